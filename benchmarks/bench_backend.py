@@ -0,0 +1,31 @@
+# SymEngine compared with sympy for the operations which support both
+
+from editor.symbolic import Sym, SYMENGINE_FUNCTIONS, hasSymengine
+from .corpus import corpus
+from .common import measure
+
+# arguments for the operations with parameters
+ARGS = {'subs': ('x', 'y + 1')}
+
+def run(sizes, repeat=3):
+  """Get dictionary of timings, empty when symengine is not installed"""
+  if not hasSymengine():
+    return {}
+  syms = {}
+  for name in ('sympy', 'symengine'):
+    syms[name] = Sym()
+    syms[name].setBackend(name)
+    syms[name].version()
+  res = {}
+  for group, items in corpus(sizes).items():
+    for n, s in items:
+      tag = '%s.%d' % (group, n)
+      for backend, sym in syms.items():
+        for name in SYMENGINE_FUNCTIONS:
+          fn = getattr(sym, name)
+          args = ARGS.get(name, ())
+          ok, _ = fn(s, *args)
+          if ok:
+            res['backend.%s.%s.%s' % (backend, name, tag)] = \
+              measure(lambda: fn(s, *args), repeat, sym.clearCache)
+  return res
@@ -0,0 +1,46 @@
+# Timing of the editor hot paths on a large buffer, needs display
+
+import hashlib
+import tkinter as tk
+
+from editor.textview import TextView
+from editor.highlight import NumberHighlighter, BracketIndex
+from editor import search
+from .corpus import document
+from .common import measure
+
+def run(lines, repeat=3):
+  """Get dictionary of timings, raise tk.TclError without display"""
+  root = tk.Tk()
+  root.withdraw()
+  try:
+    return _run(root, lines, repeat)
+  finally:
+    root.destroy()
+
+def _run(root, lines, repeat):
+  text = TextView(root, wrap='none', undo=True)
+  numbers = NumberHighlighter(text, 'number')
+  brackets = BracketIndex(text, 'unbalanced')
+  src = document(lines)
+  res = {}
+  fill = lambda: (text.delete('1.0', 'end'), text.insert('1.0', src))
+  res['editor.insert'] = measure(fill, repeat)
+  n = text.lineCount()
+  res['editor.numbers'] = measure(lambda: numbers.checkLines(1, n + 1), repeat)
+  # bracket table is rebuilt after the change of one line
+  touch = lambda: (text.insert('%d.0' % (n // 2), ' '), text.delete('%d.0' % (n // 2)))
+  res['editor.brackets'] = \
+    measure(lambda: brackets.pair(n, src.rfind('(') - src.rfind('\n') - 1), repeat, touch)
+  res['editor.content'] = measure(text.content, repeat, touch)
+  pattern = search.makePattern('x', word=True)
+  res['editor.count'] = measure(lambda: search.countMatches(text.content(), pattern), repeat)
+  def replace():
+    beg, end, s, _ = search.replaceAll(text.content(), pattern, 'w')
+    text.delete(text.offsetIndex(beg), text.offsetIndex(end))
+    text.insert(text.offsetIndex(beg), s)
+  res['editor.replace'] = measure(replace, repeat, fill)
+  res['editor.hash'] = \
+    measure(lambda: hashlib.md5(text.content().encode()).hexdigest(), repeat, touch)
+  res['editor.modified'] = measure(text.edit_modified, repeat)
+  return res
@@ -0,0 +1,59 @@
+# Fast parser compared with sympy parse_expr: same results and timing
+
+from editor.symbolic import sympy, _parser
+from editor import fastparse
+from .corpus import corpus
+from .common import measure
+
+# inputs for the equivalence check, including the ones for fallback
+SAMPLES = [
+  'x', '2', '-2', '2.5', '.5', '1e-3', '3.0E+2', 'x + y', 'x - y - z', '-x + 1',
+  'a*b*c', 'a*(b*c)', '(a*b)*c', 'a/b/c', '-a/b', 'a/(b*c)', 'a*b/c', '2/4', '1/x',
+  'x^2', 'x**2', 'x^y^z', '-x^2', 'x^-1', '2^(1/2)', '(x + 1)^3 - (x - 1)^3',
+  'a - (b - c)', 'a - b*c', '-(a + b)', '+x', '--x', 'x*-y', '(((x)))',
+  'sin(x)^2 + cos(x)^2', 'log(x, 2)', 'exp(-x^2/2)', 'sqrt(x^2 + y^2)', 'Abs(-x)',
+  'pi*r^2', 'E^x', 'I*x', 'oo', 'x1 + x_2 + alpha', 'sin(pi/6)', 'log(0)',
+  'x == y', '2x', 'f(x)', 'gamma(x)', 'N', 'S(1)/2', '1_000', 'x!', 'lambda', '0x10',
+  '007', 'x.y', 'sin', '', '(x', 'x)', 'x ^ y',
+]
+
+def _reference(s, xor, evaluate):
+  """Result of parse_expr or exception type"""
+  trans = _parser.standard_transformations + ((_parser.convert_xor,) if xor else ())
+  try:
+    return sympy.srepr(_parser.parse_expr(s, evaluate=evaluate, transformations=trans))
+  except Exception as err:
+    return type(err)
+
+def check(items):
+  """Get list of (input, settings) where the fast parser differs"""
+  wrong = []
+  for s in items:
+    for xor in (True, False):
+      for evaluate in (True, False):
+        try:
+          res = sympy.srepr(fastparse.parse(s, xor, evaluate))
+        except fastparse.Unsupported:
+          continue
+        except Exception as err:
+          res = type(err)
+        if res != _reference(s, xor, evaluate):
+          wrong.append((s, xor, evaluate))
+  return wrong
+
+def run(sizes, repeat=3):
+  """Get dictionary of timings, raise AssertionError for wrong results"""
+  groups = corpus(sizes)
+  items = SAMPLES + [s for v in groups.values() for _, s in v]
+  wrong = check(items)
+  if wrong:
+    raise AssertionError("fast parser differs: %s" % wrong)
+  trans = _parser.standard_transformations + (_parser.convert_xor,)
+  res = {}
+  for group, items in groups.items():
+    for n, s in items:
+      tag = '%s.%d' % (group, n)
+      res['parse.fast.' + tag] = measure(lambda: fastparse.parse(s, True, False), repeat)
+      res['parse.sympy.' + tag] = measure(
+        lambda: _parser.parse_expr(s, evaluate=False, transformations=trans), repeat)
+  return res
@@ -0,0 +1,47 @@
+# Timing of the Sym operations
+
+from editor.symbolic import Sym, OPERATIONS, sympy, _expand, _factor, _cancel
+from .corpus import corpus
+from .common import measure
+
+# arguments for the operations with parameters
+ARGS = {'collect': ('x',), 'subs': ('x', 'y + 1')}
+# polynomial ring functions and their generic versions
+RING = {'expand': (_expand, 'expand'), 'factor': (_factor, 'factor'), 'cancel': (_cancel, 'cancel')}
+
+def ringVsGeneric(expr, tag, repeat):
+  """Compare polynomial ring path with the generic sympy function"""
+  res = {}
+  for name, (fast, generic) in RING.items():
+    generic = getattr(sympy, generic)
+    if fast(expr) != generic(expr):
+      raise AssertionError("%s differs for %s" % (name, expr))
+    res['ring.%s.%s' % (name, tag)] = measure(lambda: fast(expr), repeat)
+    res['generic.%s.%s' % (name, tag)] = measure(lambda: generic(expr), repeat)
+  return res
+
+def run(sizes, repeat=3):
+  """Get dictionary of timings"""
+  sym = Sym()
+  sym.version()     # load sympy before measurements
+  res = {}
+  for group, items in corpus(sizes).items():
+    for n, s in items:
+      tag = '%s.%d' % (group, n)
+      res['sym.parse.' + tag] = measure(lambda: sym._parse(s), repeat, sym.clearCache)
+      _, expr = sym._parse(s)
+      res['sym.toString.' + tag] = measure(lambda: sym._toString(expr), repeat)
+      if group in ('poly', 'ratio'):
+        res.update(ringVsGeneric(expr, tag, repeat))
+      for name in OPERATIONS:
+        fn = getattr(sym, name)
+        args = ARGS.get(name, ())
+        try:
+          ok, _ = fn(s, *args)
+        except Exception:
+          ok = False
+        if not ok:
+          continue    # not applicable, failures are not timed
+        res['sym.%s.%s' % (name, tag)] = \
+          measure(lambda: fn(s, *args), repeat, sym.clearCache)
+  return res
@@ -0,0 +1,14 @@
+# Timing helpers
+
+import time
+
+def measure(fn, repeat=3, setup=None):
+  """Minimal time of fn() execution, setup() is called before each run"""
+  best = float('inf')
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    t = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t)
+  return best
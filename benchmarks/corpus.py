@@ -0,0 +1,47 @@
+# Reproducible set of expressions of growing size
+
+SIZES = (2, 4, 8, 16)
+
+def polynomials(sizes=SIZES):
+  """Powers of multivariate sums"""
+  return [(n, '(x + 2*y - z + %d)^%d' % (n, n)) for n in sizes]
+
+def rationals(sizes=SIZES):
+  """Sums of simple fractions"""
+  res = []
+  for n in sizes:
+    terms = ['%d/(x + %d)' % (k + 1, k) for k in range(n)]
+    res.append((n, ' + '.join(terms)))
+  return res
+
+def trigonometry(sizes=SIZES):
+  """Trigonometric identities"""
+  res = []
+  for n in sizes:
+    terms = ['sin(%d*x)^2 + cos(%d*x)^2' % (k + 1, k + 1) for k in range(n)]
+    res.append((n, ' + '.join(terms)))
+  return res
+
+def logarithms(sizes=SIZES):
+  """Logarithm identities"""
+  res = []
+  for n in sizes:
+    terms = ['log(x^%d*y) - log(y)' % (k + 1) for k in range(n)]
+    res.append((n, ' + '.join(terms)))
+  return res
+
+def corpus(sizes=SIZES):
+  """All the groups of expressions"""
+  return {
+    'poly': polynomials(sizes),
+    'ratio': rationals(sizes),
+    'trig': trigonometry(sizes),
+    'log': logarithms(sizes),
+  }
+
+def document(lines=20000):
+  """Text for the editor benchmarks"""
+  res = []
+  for i in range(lines):
+    res.append('a%d = (x + %d.5)*(y - %d) / (z^2 + sin(%d*x))' % (i, i, i % 7, i % 11))
+  return '\n'.join(res)
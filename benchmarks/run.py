@@ -0,0 +1,85 @@
+# Run benchmarks, save results as JSON and compare with the baseline
+#
+# Usage: python -m benchmarks.run [-o results.json] [--save-baseline]
+
+import os
+import sys
+import json
+import platform
+import argparse
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+def meta():
+  """Environment description"""
+  from editor.symbolic import sympy, hasSymengine, _symengineModule
+  res = {'python': platform.python_version(), 'platform': platform.platform(),
+         'sympy': sympy.__version__}
+  if hasSymengine():
+    res['symengine'] = _symengineModule().__version__
+  return res
+
+def compare(results, baseline, tolerance):
+  """Get list of (name, old, new) for the slower results"""
+  slow = []
+  for name, t in sorted(results.items()):
+    old = baseline.get(name)
+    if old is not None and t > old * (1 + tolerance):
+      slow.append((name, old, t))
+  return slow
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+    description="Measure Sym operations and editor hot paths")
+  parser.add_argument('-o', '--output', help="file for the JSON results")
+  parser.add_argument('-b', '--baseline', default=BASELINE, help="results to compare with")
+  parser.add_argument('--save-baseline', action='store_true', help="store results as the new baseline")
+  parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+  parser.add_argument('--repeat', type=int, default=3, help="runs for each measurement")
+  parser.add_argument('--full', action='store_true', help="include the biggest expressions")
+  parser.add_argument('--lines', type=int, default=20000, help="lines in the editor buffer")
+  parser.add_argument('--skip', action='append', default=[], choices=['sym', 'parse', 'backend', 'editor'],
+    help="suite to skip")
+  args = parser.parse_args(argv)
+
+  from .corpus import SIZES
+  results = {}
+  if 'sym' not in args.skip:
+    from . import bench_sym
+    results.update(bench_sym.run(SIZES if args.full else SIZES[:-1], args.repeat))
+  if 'parse' not in args.skip:
+    from . import bench_parse
+    results.update(bench_parse.run(SIZES if args.full else SIZES[:-1], args.repeat))
+  if 'backend' not in args.skip:
+    from . import bench_backend
+    results.update(bench_backend.run(SIZES if args.full else SIZES[:-1], args.repeat))
+  if 'editor' not in args.skip:
+    from . import bench_editor
+    try:
+      results.update(bench_editor.run(args.lines, args.repeat))
+    except Exception as err:   # no display
+      sys.stderr.write("editor benchmarks skipped: %s\n" % err)
+
+  data = {'meta': meta(), 'results': results}
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(data, f, indent=1, sort_keys=True)
+  else:
+    for name, t in sorted(results.items()):
+      print('%-40s %10.6f' % (name, t))
+  if args.save_baseline:
+    with open(args.baseline, 'w') as f:
+      json.dump(data, f, indent=1, sort_keys=True)
+    return 0
+  if not os.path.exists(args.baseline):
+    sys.stderr.write("No baseline %s, save it with --save-baseline\n" % args.baseline)
+    return 0
+  with open(args.baseline) as f:
+    base = json.load(f)['results']
+  slow = compare(results, base, args.tolerance)
+  for name, old, new in slow:
+    print('SLOWER %-40s %10.6f -> %10.6f' % (name, old, new))
+  return 1 if slow else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
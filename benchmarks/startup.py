@@ -0,0 +1,59 @@
+# Startup timing: time to the first paint of the window
+# and to the first result of the symbolical operation
+#
+# Usage: python benchmarks/startup.py [-n N]
+
+import time
+T0 = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure():
+  """Start editor in the current process and print timings as JSON"""
+  sys.path.insert(0, ROOT)
+  import tkinter as tk
+  from editor import Editor
+  root = tk.Tk()
+  root.mainloop = lambda: None    # return from the Editor constructor
+  ed = Editor(root, "bench")
+  root.update()
+  paint = time.perf_counter() - T0
+  res = []
+  ed.engine.submit('expand', ['(x+1)^2'], done=res.append)
+  while not res:
+    root.update()
+    ed.engine.poll()
+    time.sleep(0.005)
+  transform = time.perf_counter() - T0
+  ed.engine.close()
+  root.destroy()
+  print(json.dumps({'first_paint': paint, 'first_transform': transform}))
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure TermIt startup time")
+  parser.add_argument('-n', type=int, default=5, help="number of runs")
+  parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.child:
+    measure()
+    return 0
+  runs = []
+  for _ in range(args.n):
+    out = subprocess.run([sys.executable, __file__, '--child'],
+      capture_output=True, text=True)
+    if out.returncode != 0:
+      sys.stderr.write(out.stderr)
+      return 1
+    runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+  res = {k: min(r[k] for r in runs) for k in runs[0]}
+  print(json.dumps(res, indent=2))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
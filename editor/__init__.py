@@ -1,3 +1,9 @@
 # 2021, S.Mikhel
 
-from .editor import Editor
+def __getattr__(name):
+  # import GUI only when it is requested,
+  # editor.cli and the worker processes don't need tkinter
+  if name == 'Editor':
+    from .editor import Editor
+    return Editor
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,267 @@
+# Large-file mode: the file is memory-mapped, only a window
+# of lines around the viewport is kept in the text widget
+
+import os
+import mmap
+import array
+import hashlib
+import itertools
+
+from .fileio import encoding, saveChunks
+from . import perf
+
+BIG_FILE = 64 << 20      # open bigger files in the large-file mode
+INDEX_CHUNK = 16 << 20   # bytes scanned for line ends in one idle callback
+WINDOW_LINES = 4000      # lines loaded into the widget
+WINDOW_MARGIN = 500      # move window when the view is closer to its edge
+SAVE_CHUNK = 16 << 20    # bytes of the original file written at once
+SAVE_LINES = 10000       # edited lines written at once
+
+
+class LineIndex:
+  """Offsets of the line beginnings in the memory-mapped file"""
+
+  def __init__(self, name):
+    self.size = os.path.getsize(name)
+    self._file = open(name, 'rb')
+    self.map = None
+    if self.size:
+      self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    self.starts = array.array('q', [0])
+    self.md5 = hashlib.md5()
+    self.pos = 0
+    self.enc = encoding()
+    self.damaged = False     # some lines are decoded with replacement characters
+
+  def step(self):
+    """Scan next chunk, return True when the whole file is indexed"""
+    data = self.map[self.pos:self.pos+INDEX_CHUNK] if self.map is not None else b''
+    self.md5.update(data)
+    if data:
+      # lengths of the pieces between '\n' converted to offsets
+      parts = data.split(b'\n')
+      offsets = itertools.accumulate((len(v) + 1 for v in parts[:-1]), initial=self.pos)
+      next(offsets)   # the initial value is already saved
+      self.starts.extend(offsets)
+      self.pos += len(data)
+      return False
+    # offset after the virtual end of the last line
+    self.starts.append(self.size + 1)
+    return True
+
+  def lineCount(self):
+    return len(self.starts) - 1
+
+  def raw(self, beg, end):
+    """Bytes of the lines from beg to end (exclusive) without the last line end"""
+    return self.map[self.starts[beg]:self.starts[end]-1] if self.map is not None else b''
+
+  def lines(self, beg, end):
+    """Decoded lines"""
+    data = self.raw(beg, end)
+    try:
+      s = data.decode(self.enc)
+    except UnicodeDecodeError:
+      self.damaged = True
+      s = data.decode(self.enc, errors='replace')
+    if s.endswith('\r'):
+      s = s[:-1]   # end of the last line is '\r\n'
+    return s.replace('\r\n', '\n').split('\n')
+
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+    self._file.close()
+
+
+class PieceTable:
+  """Document as list of pieces (lines, first, n): n lines of the original
+  file beginning from the first one when lines is None, or added lines"""
+
+  def __init__(self, index):
+    self.index = index
+    self.pieces = [(None, 0, index.lineCount())]
+
+  def lineCount(self):
+    return sum(n for _, _, n in self.pieces)
+
+  def _split(self, line):
+    """Make piece boundary at the line, return piece position"""
+    acc = 0
+    for i, (src, first, n) in enumerate(self.pieces):
+      if line == acc:
+        return i
+      if line < acc + n:
+        k = line - acc
+        self.pieces[i:i+1] = [(src, first, k), (src, first + k, n - k)]
+        return i + 1
+      acc += n
+    return len(self.pieces)
+
+  def lines(self, beg, end):
+    """Get list of lines from beg to end (exclusive)"""
+    res, acc = [], 0
+    for src, first, n in self.pieces:
+      a, b = max(beg, acc), min(end, acc + n)
+      if a < b:
+        a, b = first + a - acc, first + b - acc
+        res.extend(self.index.lines(a, b) if src is None else src[a:b])
+      acc += n
+      if acc >= end:
+        break
+    return res
+
+  def replace(self, beg, end, lines):
+    """Put new lines instead of the lines from beg to end (exclusive)"""
+    i = self._split(beg)
+    j = self._split(end)
+    self.pieces[i:j] = [(lines, 0, len(lines))] if lines else []
+
+  def chunks(self):
+    """Content as encoded blocks, the original lines are copied without decoding"""
+    sep = os.linesep.encode(self.index.enc)
+    for k, (src, first, n) in enumerate(self.pieces):
+      if k:
+        yield sep
+      if src is None:
+        beg, end = self.index.starts[first], self.index.starts[first + n] - 1
+        for pos in range(beg, end, SAVE_CHUNK):
+          yield self.index.map[pos:min(pos + SAVE_CHUNK, end)]
+      else:
+        for pos in range(first, first + n, SAVE_LINES):
+          block = os.linesep.join(src[pos:min(pos + SAVE_LINES, first + n)])
+          yield (sep if pos > first else b'') + block.encode(self.index.enc)
+
+
+class LargeFile:
+  """Show part of the big file in the text widget. Edits are moved
+  to the piece table when the window is changed or the file is saved.
+  Undecodable bytes are shown as replacement characters, the file
+  is not saved if such lines were edited."""
+
+  def __init__(self, text, scroll, name, progress=None, done=None, busy=None):
+    self.text = text
+    self.scroll = scroll
+    self.name = name
+    self.progress = progress
+    self.done = done
+    self.busy = busy         # window is not moved while busy() is True
+    self.index = LineIndex(name)
+    self.table = None
+    self.top = 0             # first line in the widget
+    self.count = 0           # number of lines in the widget
+    self.modified = False
+    self.lossy = False       # edited lines had undecodable bytes
+    self._damaged = False    # window has undecodable bytes
+    self._gen = None
+    self._after = None
+
+  def start(self):
+    """Build the line index in idle time"""
+    self.text.configure(state='disabled')
+    self._after = self.text.after_idle(self._step)
+
+  def _step(self):
+    self._after = None
+    with perf.span('bigfile.index'):
+      final = self.index.step()
+    if self.progress is not None:
+      self.progress(self.index.pos, self.index.size)
+    if not final:
+      self._after = self.text.after_idle(self._step)
+      return
+    self.table = PieceTable(self.index)
+    self.text.configure(state='normal')
+    self.scroll.configure(command=self.yview)
+    self.text.configure(yscrollcommand=self.onScroll)
+    self._load(0)
+    if self.done is not None:
+      self.done(self.index.md5.hexdigest())
+
+  def close(self):
+    """Stop indexing and restore normal scrolling"""
+    if self._after is not None:
+      self.text.after_cancel(self._after)
+      self._after = None
+    self.text.configure(state='normal', yscrollcommand=self.scroll.set)
+    self.scroll.configure(command=self.text.yview)
+    self.index.close()
+
+  def lineCount(self):
+    """Total number of lines"""
+    return self.table.lineCount() - self.count + self.text.lineCount()
+
+  def flush(self):
+    """Save changes of the widget to the piece table"""
+    if self._gen is None or self._gen == self.text.generation:
+      return   # window is not loaded or not changed
+    lines = self.text.content().split('\n')
+    self.table.replace(self.top, self.top + self.count, lines)
+    self.count = len(lines)
+    self._gen = self.text.generation
+    self.modified = True
+    self.lossy = self.lossy or self._damaged
+
+  def _load(self, top, view=None):
+    """Show lines beginning from top, view is the first visible line"""
+    with perf.span('bigfile.window'):
+      line, col = self.text.index('insert').split('.')
+      cursor = self.top + int(line) - 1
+      self.flush()
+      total = self.table.lineCount()
+      self.top = max(0, min(top, total - WINDOW_LINES))
+      self.index.damaged = False
+      lines = self.table.lines(self.top, self.top + WINDOW_LINES)
+      self._damaged = self.index.damaged
+      self.count = len(lines)
+      modified = self.text.edit_modified()
+      self.text.delete('1.0', 'end')
+      self.text.insert('1.0', '\n'.join(lines))
+      self.text.edit_reset()
+      self.text.edit_modified(modified)
+      self._gen = self.text.generation
+      if self.top <= cursor < self.top + self.count:
+        self.text.mark_set('insert', '%d.%s' % (cursor - self.top + 1, col))
+      line = (view if view is not None else self.top) - self.top + 1
+      self.text.yview('%d.0' % line)
+
+  def _moveTo(self, line):
+    """Show the line, load new window when need"""
+    if self.top <= line < self.top + self.count:
+      self.text.yview('%d.0' % (line - self.top + 1))
+    elif self.busy is None or not self.busy():
+      self._load(line - WINDOW_LINES // 2, line)
+
+  def yview(self, *args):
+    """Scrollbar command"""
+    if args and args[0] == 'moveto':
+      self._moveTo(int(float(args[1]) * self.lineCount()))
+    else:
+      self.text.yview(*args)
+
+  def onScroll(self, f0, f1):
+    """Update scrollbar for the position in the whole file,
+    load next window when the view is close to the edge"""
+    n, total = self.text.lineCount(), self.lineCount()
+    first, last = self.top + float(f0) * n, self.top + float(f1) * n
+    self.scroll.set(first / total, last / total)
+    near = (float(f0) * n < WINDOW_MARGIN and self.top > 0) or \
+           ((1 - float(f1)) * n < WINDOW_MARGIN and self.top + n < total)
+    if near and self._after is None and (self.busy is None or not self.busy()):
+      self._after = self.text.after_idle(self._shift, int(first))
+
+  def _shift(self, line):
+    self._after = None
+    self._load(line - WINDOW_LINES // 2, line)
+
+  def save(self, name):
+    """Write document to the file, return md5"""
+    self.flush()
+    if self.lossy:
+      raise UnicodeError("Edited lines are not %s text, the file is not saved" % self.index.enc)
+    with perf.span('bigfile.save'):
+      digest = saveChunks(name, self.table.chunks())
+    # the old file is still mapped, so the table remains valid
+    self.modified = False
+    return digest
@@ -0,0 +1,125 @@
+# Command line interface, apply symbolical operations
+# to each line of the file without GUI
+#
+# Usage: python -m editor.cli -o expand,factor,subs:x=y [-j N] [file]
+
+import sys
+import argparse
+import collections
+import concurrent.futures as cf
+
+from .symbolic import Sym, parseOps, BACKENDS, hasSymengine
+
+CHUNK = 64       # lines per task for parallel processing
+AHEAD = 4        # number of waiting tasks per worker
+
+_sym = None
+_ops = None
+
+def processLines(lines):
+  """Transform list of lines, skip empty ones"""
+  res = []
+  for s in lines:
+    if s.strip():
+      try:
+        ok, out = _sym.pipeline(s, _ops)
+        res.append((ok, out if ok else str(out)))
+      except Exception as err:
+        res.append((False, str(err)))
+    else:
+      res.append((True, s))
+  return res
+
+def _init(settings, ops):
+  """Prepare worker state"""
+  global _sym, _ops
+  _sym = Sym()
+  _sym.setSettings(settings)
+  _ops = ops
+
+def _chunks(src, n):
+  """Read lines by groups of n"""
+  lines = []
+  for s in src:
+    lines.append(s.rstrip('\r\n'))
+    if len(lines) == n:
+      yield lines
+      lines = []
+  if lines:
+    yield lines
+
+def _write(dst, lines, results, first):
+  """Print results, return number of errors"""
+  errors = 0
+  for i, (s, (ok, res)) in enumerate(zip(lines, results)):
+    if ok:
+      dst.write(res)
+    else:
+      sys.stderr.write("line %d: %s\n" % (first + i, res))
+      dst.write(s)
+      errors += 1
+    dst.write('\n')
+  return errors
+
+def run(src, dst, ops, settings, jobs=1):
+  """Process lines from src and write to dst, return number of errors"""
+  errors, line = 0, 1
+  if jobs <= 1:
+    _init(settings, ops)
+    for lines in _chunks(src, CHUNK):
+      errors += _write(dst, lines, processLines(lines), line)
+      line += len(lines)
+    return errors
+  # parallel, keep order and limit the number of lines in memory
+  with cf.ProcessPoolExecutor(jobs, initializer=_init, initargs=(settings, ops)) as pool:
+    waiting = collections.deque()
+    for lines in _chunks(src, CHUNK):
+      waiting.append((lines, pool.submit(processLines, lines)))
+      if len(waiting) >= jobs * AHEAD:
+        lines, fut = waiting.popleft()
+        errors += _write(dst, lines, fut.result(), line)
+        line += len(lines)
+    while waiting:
+      lines, fut = waiting.popleft()
+      errors += _write(dst, lines, fut.result(), line)
+      line += len(lines)
+  return errors
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m editor.cli',
+    description="Apply symbolical operations to each line of the file")
+  parser.add_argument('file', nargs='?', default='-', help="input file, '-' for stdin")
+  parser.add_argument('-o', '--ops', required=True,
+    help="comma separated operations, e.g. expand,collect:x,subs:x=y")
+  parser.add_argument('-j', '--jobs', type=int, default=1, help="number of worker processes")
+  parser.add_argument('--eval', action='store_true', help="simplify expression during the parsing")
+  parser.add_argument('--no-xor', action='store_true', help="use '**' instead of '^' for power")
+  parser.add_argument('--cache', action='store_true',
+    help="keep results in the persistent cache")
+  parser.add_argument('--cse', action='store_true',
+    help="print common subexpressions as separate assignments")
+  parser.add_argument('--backend', choices=BACKENDS, default='sympy',
+    help="library for the operations which support SymEngine")
+  args = parser.parse_args(argv)
+  if args.backend == 'symengine' and not hasSymengine():
+    parser.error("symengine is not installed")
+  try:
+    ops = parseOps(args.ops)
+  except ValueError as err:
+    parser.error(str(err))
+  sym = Sym()
+  sym.simpParse(args.eval)
+  sym.powXOR(not args.no_xor)
+  sym.compact(args.cse)
+  sym.persist(args.cache)
+  sym.setBackend(args.backend)
+  src = sys.stdin if args.file == '-' else open(args.file, 'rt')
+  try:
+    errors = run(src, sys.stdout, ops, sym.getSettings(), args.jobs)
+  finally:
+    if src is not sys.stdin:
+      src.close()
+  return 1 if errors else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
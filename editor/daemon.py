@@ -0,0 +1,501 @@
+# Shared compute server: the Sym operations of several editors
+# are processed by one warm pool of workers
+#
+# Usage: python -m editor.daemon [-j N] [--socket PATH]
+#
+# Protocol: JSON objects separated by '\n' over the Unix socket.
+#   request  {"id": 1, "op": "expand", "s": "...", "args": [], "settings": {...},
+#             "timeout": 60, "urgent": true}
+#   cancel   {"cancel": 1, "kill": true}
+#   response {"id": 1, "ok": true, "res": "..."}, "busy": true when rejected
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import struct
+import argparse
+import tempfile
+import selectors
+import itertools
+
+from .engine import Engine, TIMEOUT, _Job
+from .symbolic import LruCache, Sym, OPERATIONS
+from . import perf
+
+CACHE_SIZE = 4096        # number of results shared by the clients
+CACHE_MEM = 64 << 20     # their memory limit, bytes
+MAX_QUEUE = 1000         # waiting requests before the new ones are rejected
+MAX_OUTPUT = 16 << 20    # unsent bytes before the client requests are not read
+MAX_LINE = 64 << 20      # maximal request size, bytes
+POLL_S = 0.02            # period of the worker checks, s
+CONNECT_TIMEOUT = 0.2    # waiting for the server, s
+
+def socketPath():
+  """Default address of the server"""
+  base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+  return os.path.join(base, 'termit-%d.sock' % os.getuid())
+
+# Sym methods available to the clients
+METHODS = frozenset(OPERATIONS) | {'pipeline', 'version', 'defsExpand', 'defsEvaluate', 'grid'}
+
+def _isInt(v):
+  return isinstance(v, int) and not isinstance(v, bool)
+
+def _checkRequest(msg, settings):
+  """Error message for the wrong request or None"""
+  if not _isInt(msg.get('id')):
+    return "'id' must be integer"
+  if msg.get('op') not in METHODS:
+    return "Unknown operation %r" % (msg.get('op'),)
+  if not isinstance(msg.get('s'), str):
+    return "'s' must be string"
+  if not isinstance(msg.get('args', []), list):
+    return "'args' must be list"
+  st = msg.get('settings')
+  if st is not None and not (isinstance(st, dict) and st.keys() == settings.keys()):
+    return "'settings' must have keys %s" % ', '.join(sorted(settings))
+  timeout = msg.get('timeout')
+  if timeout is not None and (isinstance(timeout, bool) or
+      not isinstance(timeout, (int, float)) or timeout <= 0):
+    return "'timeout' must be positive number"
+  return None
+
+def _peerUid(sock):
+  """User of the process on the other side of the socket, or None if unknown"""
+  opt = getattr(socket, 'SO_PEERCRED', None)
+  if opt is None:
+    return None
+  creds = sock.getsockopt(socket.SOL_SOCKET, opt, struct.calcsize('3i'))
+  return struct.unpack('3i', creds)[1]
+
+def _encode(msg):
+  return json.dumps(msg).encode('utf-8') + b'\n'
+
+def _decode(buf):
+  """Split received bytes to messages and the unfinished rest"""
+  *lines, rest = buf.split(b'\n')
+  return [json.loads(v) for v in lines if v.strip()], rest
+
+
+class _Client:
+  """Connection state on the server side"""
+
+  def __init__(self, sock):
+    self.sock = sock
+    self.inp = b''
+    self.out = bytearray()
+    self.requests = {}    # request id: key
+
+
+class Server:
+  """Accept requests, share results and running tasks between the clients"""
+
+  def __init__(self, path=None, nproc=None, maxqueue=MAX_QUEUE):
+    self.path = path or socketPath()
+    self.maxqueue = maxqueue
+    self.engine = Engine(nproc)
+    self.cache = LruCache(CACHE_SIZE, CACHE_MEM)
+    self.pending = {}     # key: (job id, list of (client, request id))
+    self.settings = Sym().getSettings()   # default for the requests
+    self._sel = selectors.DefaultSelector()
+    self._listener = None
+
+  def start(self):
+    """Open the socket and load sympy in all the workers"""
+    if os.path.exists(self.path):
+      probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      try:
+        probe.connect(self.path)
+      except OSError:
+        os.unlink(self.path)   # left after crash
+      else:
+        raise OSError("Server is already running at %s" % self.path)
+      finally:
+        probe.close()
+    self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old = os.umask(0o177)     # only for the current user
+    try:
+      self._listener.bind(self.path)
+    finally:
+      os.umask(old)
+    self._listener.listen()
+    self._listener.setblocking(False)
+    self._sel.register(self._listener, selectors.EVENT_READ)
+    settings = Sym().getSettings()
+    for _ in range(self.engine.nproc):
+      self.engine.submit('version', [''], settings=settings)
+
+  def serve(self):
+    """Main loop"""
+    while True:
+      for key, events in self._sel.select(POLL_S):
+        if key.fileobj is self._listener:
+          self._accept()
+          continue
+        client = key.data
+        if events & selectors.EVENT_READ:
+          self._read(client)
+        if events & selectors.EVENT_WRITE and client.sock.fileno() >= 0:
+          self._write(client)
+      self.engine.poll()
+
+  def close(self):
+    """Stop the workers and remove the socket"""
+    self.engine.close()
+    for key in list(self._sel.get_map().values()):
+      key.fileobj.close()
+    self._sel.close()
+    if self._listener is not None and os.path.exists(self.path):
+      os.unlink(self.path)
+
+  # ====== connections ========
+
+  def _accept(self):
+    try:
+      sock, _ = self._listener.accept()
+    except OSError:
+      return
+    sock.setblocking(False)
+    self._sel.register(sock, selectors.EVENT_READ, _Client(sock))
+
+  def _events(self, client):
+    """Stop reading from the client which does not read the results"""
+    ev = selectors.EVENT_READ if len(client.out) < MAX_OUTPUT else 0
+    if client.out:
+      ev |= selectors.EVENT_WRITE
+    self._sel.modify(client.sock, ev, client)
+
+  def _drop(self, client):
+    """Close connection and forget its requests"""
+    for rid in list(client.requests):
+      self._cancel(client, rid, False)
+    self._sel.unregister(client.sock)
+    client.sock.close()
+
+  def _read(self, client):
+    try:
+      data = client.sock.recv(1 << 16)
+    except BlockingIOError:
+      return
+    except OSError:
+      data = b''
+    if not data:
+      self._drop(client)
+      return
+    client.inp += data
+    try:
+      msgs, client.inp = _decode(client.inp)
+    except ValueError:
+      msgs = None
+    if msgs is None or len(client.inp) > MAX_LINE:
+      self._drop(client)   # not a protocol client
+      return
+    for msg in msgs:
+      if not isinstance(msg, dict):
+        self._drop(client)
+        return
+      if 'cancel' in msg:
+        if _isInt(msg['cancel']):
+          self._cancel(client, msg['cancel'], bool(msg.get('kill', True)))
+        continue
+      err = _checkRequest(msg, self.settings)
+      if err is not None:
+        rid = msg.get('id')
+        self._reply(client, {'id': rid if _isInt(rid) else None, 'ok': False, 'res': err})
+        continue
+      try:
+        self._request(client, msg)
+      except Exception as err:   # the server is shared, only this client is dropped
+        sys.stderr.write("Request failed: %r\n" % err)
+        self._drop(client)
+        return
+    self._events(client)
+
+  def _write(self, client):
+    try:
+      n = client.sock.send(client.out)
+    except BlockingIOError:
+      return
+    except OSError:
+      self._drop(client)
+      return
+    del client.out[:n]
+    self._events(client)
+
+  def _reply(self, client, msg):
+    if client.sock.fileno() < 0:
+      return   # disconnected
+    client.out += _encode(msg)
+    self._events(client)
+
+  # ====== requests ========
+
+  def _request(self, client, msg):
+    """Answer from cache, join the same running task or start new one"""
+    rid = msg['id']
+    name, s, args = msg['op'], msg['s'], tuple(msg.get('args', ()))
+    settings = msg.get('settings') or self.settings
+    key = json.dumps([name, s, args, sorted(settings.items())])
+    res = self.cache.get(key)
+    if res is not None:
+      self._reply(client, {'id': rid, 'ok': True, 'res': res})
+      return
+    waiting = self.pending.get(key)
+    if waiting is not None:
+      waiting[1].append((client, rid))
+    elif len(self.pending) >= self.maxqueue:
+      self._reply(client, {'id': rid, 'ok': False, 'res': "Server is busy", 'busy': True})
+      return
+    else:
+      jid = self.engine.submit(name, [s], args, settings, msg.get('timeout'),
+        done=lambda r: self._done(key, r[0]), urgent=bool(msg.get('urgent', False)))
+      self.pending[key] = (jid, [(client, rid)])
+    client.requests[rid] = key
+
+  def _done(self, key, result):
+    """Send result to all the clients which wait for it"""
+    ok, res = result
+    if ok:
+      self.cache.put(key, res, sys.getsizeof(res))
+    _, waiting = self.pending.pop(key)
+    for client, rid in waiting:
+      client.requests.pop(rid, None)
+      self._reply(client, {'id': rid, 'ok': ok, 'res': res})
+
+  def _cancel(self, client, rid, kill):
+    """Forget the request, stop the task if nobody waits for it"""
+    key = client.requests.pop(rid, None)
+    if key is None:
+      return
+    jid, waiting = self.pending[key]
+    waiting.remove((client, rid))
+    if not waiting:
+      del self.pending[key]
+      self.engine.cancel(jid, kill)
+
+
+class _Request:
+  """Single string sent to the server"""
+
+  def __init__(self, job, pos, name, s, args, settings, timeout, urgent):
+    self.job = job
+    self.pos = pos
+    self.call = (name, s, args, settings, timeout, urgent)
+    self.local = None     # job id in the local engine
+
+
+class DaemonClient:
+  """Engine interface for the server, tasks are processed by the local
+  engine when the server is overloaded or the connection is lost"""
+
+  def __init__(self, sock, timeout=TIMEOUT):
+    self.timeout = timeout
+    self._sock = sock
+    self._sock.setblocking(False)
+    self._inp = b''
+    self._out = bytearray()
+    self._jobs = {}
+    self._requests = {}   # request id: _Request
+    self._ids = itertools.count(1)
+    self._local = None
+
+  def submit(self, name, items, args=(), settings=None, timeout=None, done=None, urgent=False):
+    """Apply Sym method to each string from items, return job id"""
+    jid = next(self._ids)
+    job = _Job(jid, len(items), done)
+    job.name = name
+    job.started = time.perf_counter()
+    self._jobs[jid] = job
+    settings = settings or Sym().getSettings()
+    timeout = timeout or self.timeout
+    for pos, s in enumerate(items):
+      rid = next(self._ids)
+      req = self._requests[rid] = \
+        _Request(job, pos, name, s, tuple(args), settings, timeout, urgent)
+      if self._sock is None:
+        self._runLocal(rid, req)
+      else:
+        self._out += _encode({'id': rid, 'op': name, 's': s, 'args': list(args),
+          'settings': settings, 'timeout': timeout, 'urgent': urgent})
+    if not items:
+      self._finish(job)
+    self._flush()
+    return jid
+
+  def cancel(self, jid=None, kill=True):
+    """Stop the job, or all jobs if jid is None"""
+    if jid is None:
+      jobs = set(self._jobs)
+    elif jid in self._jobs:
+      jobs = {jid}
+    else:
+      return False
+    for rid, req in list(self._requests.items()):
+      if req.job.jid in jobs:
+        del self._requests[rid]
+        if req.local is not None:
+          self._local.cancel(req.local, kill)
+        elif self._sock is not None:
+          self._out += _encode({'cancel': rid, 'kill': kill})
+    for j in jobs:
+      del self._jobs[j]
+    self._flush()
+    return True
+
+  def busy(self):
+    """Check if there are unfinished jobs"""
+    return bool(self._jobs)
+
+  def progress(self, jid):
+    """Get number of processed and total tasks"""
+    job = self._jobs.get(jid)
+    if job is None:
+      return 0, 0
+    n = len(job.results)
+    return n - job.left, n
+
+  def poll(self):
+    """Send requests and collect results, return True if busy"""
+    self._flush()
+    while self._sock is not None:
+      try:
+        data = self._sock.recv(1 << 16)
+      except BlockingIOError:
+        break
+      except OSError:
+        data = b''
+      if not data:
+        self._disconnect()
+        break
+      try:
+        msgs, self._inp = _decode(self._inp + data)
+      except ValueError:
+        self._disconnect()
+        break
+      for msg in msgs:
+        self._receive(msg)
+    if self._local is not None:
+      self._local.poll()
+    return self.busy()
+
+  def close(self):
+    """Close connection and the local engine"""
+    self._jobs.clear()
+    self._requests.clear()
+    if self._sock is not None:
+      self._sock.close()
+      self._sock = None
+    if self._local is not None:
+      self._local.close()
+
+  # ====== internal ========
+
+  def _flush(self):
+    """Send as much as possible without blocking"""
+    while self._out and self._sock is not None:
+      try:
+        n = self._sock.send(self._out)
+      except BlockingIOError:
+        return
+      except OSError:
+        self._disconnect()
+        return
+      del self._out[:n]
+
+  def _disconnect(self):
+    """Continue unfinished tasks in the local engine"""
+    self._sock.close()
+    self._sock = None
+    self._out.clear()
+    for rid, req in list(self._requests.items()):
+      if req.local is None:
+        self._runLocal(rid, req)
+
+  def _runLocal(self, rid, req):
+    if self._local is None:
+      self._local = Engine()
+    name, s, args, settings, timeout, urgent = req.call
+    req.local = self._local.submit(name, [s], args, settings, timeout,
+      done=lambda r: self._store(rid, r[0]), urgent=urgent)
+
+  def _receive(self, msg):
+    rid = msg.get('id')
+    req = self._requests.get(rid)
+    if req is None:
+      return   # cancelled
+    if msg.get('busy'):
+      self._runLocal(rid, req)
+    else:
+      self._store(rid, (msg['ok'], msg['res']))
+
+  def _store(self, rid, result):
+    """Save result of the request"""
+    req = self._requests.pop(rid, None)
+    if req is None:
+      return
+    job = req.job
+    job.results[req.pos] = tuple(result)
+    job.left -= 1
+    if job.left == 0:
+      self._finish(job)
+
+  def _finish(self, job):
+    del self._jobs[job.jid]
+    perf.add('daemon.' + job.name, job.started, time.perf_counter() - job.started)
+    if job.done is not None:
+      job.done(job.results)
+
+
+def connect(path=None, timeout=TIMEOUT):
+  """Get client for the running server or None, the socket and
+  the server process must belong to the current user"""
+  path = path or socketPath()
+  try:
+    if os.stat(path).st_uid != os.getuid():
+      return None    # created by other user, e.g. in the shared /tmp
+  except OSError:
+    return None
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.settimeout(CONNECT_TIMEOUT)
+  try:
+    sock.connect(path)
+    uid = _peerUid(sock)
+  except OSError:
+    sock.close()
+    return None
+  if uid is not None and uid != os.getuid():
+    sock.close()
+    return None
+  return DaemonClient(sock, timeout)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m editor.daemon',
+    description="Serve symbolical operations to the editors of the current user")
+  parser.add_argument('-j', '--jobs', type=int, help="number of worker processes")
+  parser.add_argument('--socket', help="path of the Unix socket, default %s" % socketPath())
+  parser.add_argument('--queue', type=int, default=MAX_QUEUE,
+    help="waiting requests before the new ones are rejected")
+  args = parser.parse_args(argv)
+  server = Server(args.socket, args.jobs, args.queue)
+  try:
+    server.start()
+  except OSError as err:
+    sys.stderr.write("%s\n" % err)
+    return 1
+  sys.stderr.write("Listening on %s\n" % server.path)
+  # remove the socket on kill as well
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+  try:
+    server.serve()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.close()
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -2,6 +2,9 @@
 
 import tkinter as tk
 import tkinter.simpledialog 
+import tkinter.filedialog as filedialog
+
+from . import perf
 
 class FindDlg(tk.simpledialog.Dialog):
   """Create dialog to find the text"""
@@ -45,11 +48,14 @@ class FindDlg(tk.simpledialog.Dialog):
 class ReplaceDlg(tk.simpledialog.Dialog):
   """Create dialog to replace the found strings"""
 
-  def __init__(self, parent, title, fnd, repl):
+  def __init__(self, parent, title, fnd, repl, counter=None):
     self.find = fnd
     self.replace = repl
     self.nocase = 0
     self.all = 1
+    self.regex = 0
+    self.word = 0
+    self.counter = counter
     self.pressok = True
     super().__init__(parent, title)
 
@@ -63,19 +69,39 @@ class ReplaceDlg(tk.simpledialog.Dialog):
     self.ent_replace.pack()
     self.var_sens = tk.IntVar()
     self.var_all = tk.IntVar(value=1)
+    self.var_regex = tk.IntVar()
+    self.var_word = tk.IntVar()
     self.check_sens = tk.Checkbutton(frame, text="Case insensitive", variable=self.var_sens, onvalue=1, offvalue=0)
     self.check_sens.pack()
     self.check_all = tk.Checkbutton(frame, text="Replace all", variable=self.var_all, onvalue=1, offvalue=0)
     self.check_all.pack()
-
-  def on_ok(self):
-    """Button 'OK' action"""
+    self.check_regex = tk.Checkbutton(frame, text="Regular expression", variable=self.var_regex, onvalue=1, offvalue=0)
+    self.check_regex.pack()
+    self.check_word = tk.Checkbutton(frame, text="Whole word", variable=self.var_word, onvalue=1, offvalue=0)
+    self.check_word.pack()
+    if self.counter is not None:
+      self.var_count = tk.StringVar()
+      tk.Label(frame, textvariable=self.var_count).pack()
+
+  def _read(self):
+    """Get values from the widgets"""
     self.find = self.ent_find.get()
     self.replace = self.ent_replace.get()
     self.nocase = self.var_sens.get()
     self.all = self.var_all.get()
+    self.regex = self.var_regex.get()
+    self.word = self.var_word.get()
+
+  def on_ok(self):
+    """Button 'OK' action"""
+    self._read()
     self.destroy()
 
+  def on_count(self):
+    """Button 'Count' action"""
+    self._read()
+    self.var_count.set(self.counter(self.find, self.nocase, self.regex, self.word))
+
   def on_cancel(self):
     """Button 'Cancel' action"""
     self.pressok = False
@@ -85,6 +111,9 @@ class ReplaceDlg(tk.simpledialog.Dialog):
     """Buttons and bindings"""
     self.btn_ok = tk.Button(self, text='OK', width=5, command=self.on_ok)
     self.btn_ok.pack(side='left')
+    if self.counter is not None:
+      self.btn_count = tk.Button(self, text='Count', width=5, command=self.on_count)
+      self.btn_count.pack(side='left')
     self.btn_cancel = tk.Button(self, text='Cancel', width=5, command=self.on_cancel)
     self.btn_cancel.pack(side='right')
     self.bind('<Return>', lambda ev: self.on_ok)
@@ -133,3 +162,76 @@ class GetParams(tk.simpledialog.Dialog):
     self.bind('<Return>', lambda ev: self.on_ok)
     self.bind('<Escape>', lambda ev: self.on_cancel)
 
+
+class PerfWindow(tk.Toplevel):
+  """Show timings of the recent operations"""
+
+  def __init__(self, parent):
+    super().__init__(parent)
+    self.title("Performance")
+    self.text = tk.Text(self, wrap='none', width=72, height=24)
+    vscroll = tk.Scrollbar(self, command=self.text.yview, orient='vertical')
+    self.text.configure(yscrollcommand=vscroll.set)
+    self.text.grid(row=0, column=0, sticky='nsew')
+    vscroll.grid(row=0, column=1, sticky='ns')
+    self.rowconfigure(0, weight=1)
+    self.columnconfigure(0, weight=1)
+    frame = tk.Frame(self)
+    frame.grid(row=1, column=0, columnspan=2, sticky='we')
+    tk.Button(frame, text='Refresh', command=self.refresh).pack(side='left')
+    tk.Button(frame, text='Export JSON', command=self.on_json).pack(side='left')
+    tk.Button(frame, text='Export trace', command=self.on_trace).pack(side='left')
+    tk.Button(frame, text='Close', command=self.destroy).pack(side='right')
+    self.refresh()
+
+  def refresh(self):
+    """Show current statistics"""
+    lines = ['%-24s %6s %10s %10s %10s' % ('name', 'count', 'total,ms', 'mean,ms', 'max,ms')]
+    for name, (n, total, mean, top) in sorted(perf.summary().items()):
+      lines.append('%-24s %6d %10.2f %10.2f %10.2f' % (name, n, total*1e3, mean*1e3, top*1e3))
+    lines.append('')
+    lines.append('Recent:')
+    for name, _, dt, pid in reversed(perf.recent()):
+      lines.append('%-24s %10.2f ms  (pid %d)' % (name, dt*1e3, pid))
+    self.text.configure(state='normal')
+    self.text.delete('1.0', 'end')
+    self.text.insert('1.0', '\n'.join(lines))
+    self.text.configure(state='disabled')
+
+  def on_json(self):
+    """Save statistics as JSON"""
+    name = filedialog.SaveAs(self, defaultextension='.json').show()
+    if name:
+      perf.exportJson(name)
+
+  def on_trace(self):
+    """Save spans as Chrome trace"""
+    name = filedialog.SaveAs(self, defaultextension='.json').show()
+    if name:
+      perf.exportTrace(name)
+
+
+class TextWindow(tk.Toplevel):
+  """Show read-only text"""
+
+  def __init__(self, parent, title, txt):
+    super().__init__(parent)
+    self.title(title)
+    self.text = tk.Text(self, wrap='none', width=72, height=24)
+    vscroll = tk.Scrollbar(self, command=self.text.yview, orient='vertical')
+    self.text.configure(yscrollcommand=vscroll.set)
+    self.text.grid(row=0, column=0, sticky='nsew')
+    vscroll.grid(row=0, column=1, sticky='ns')
+    self.rowconfigure(0, weight=1)
+    self.columnconfigure(0, weight=1)
+    frame = tk.Frame(self)
+    frame.grid(row=1, column=0, columnspan=2, sticky='we')
+    tk.Button(frame, text='Copy', command=self.on_copy).pack(side='left')
+    tk.Button(frame, text='Close', command=self.destroy).pack(side='right')
+    self.text.insert('1.0', txt)
+    self.text.configure(state='disabled')
+
+  def on_copy(self):
+    """Copy the whole text to clipboard"""
+    self.clipboard_clear()
+    self.clipboard_append(self.text.get('1.0', 'end - 1c'))
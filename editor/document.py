@@ -0,0 +1,140 @@
+# Definitions 'name = expression' found in the text
+# and dependencies between them
+
+import re
+
+from .symbolic import LruCache
+
+ASSIGN = re.compile(r'^\s*([A-Za-z_]\w*)\s*=(?!=)(.*)$')
+LINE_CACHE = 4096      # number of parsed lines
+
+def definitions(lines):
+  """Filter lines with assignment"""
+  return [s for s in lines if ASSIGN.match(s)]
+
+
+class Document:
+  """Symbol table of the text, definitions are parsed once for each line content,
+  resolved values are updated only for the changed names and their dependents.
+  Sym keeps one document, so each worker of the pool has its own table
+  which is rebuilt when the settings of the requests change."""
+
+  def __init__(self, sym):
+    self.sym = sym
+    self.errors = []
+    self._parsed = LruCache(LINE_CACHE, LINE_CACHE << 10)
+    self._defs = {}       # name: (line, source, expr)
+    self._deps = {}       # name: names in the definition
+    self._resolved = {}   # name: expression without defined symbols
+    self._printed = {}    # name: resolved expression as string
+    self._settings = None
+
+  def _parseLine(self, s):
+    """Get (name, expr) or raise ValueError"""
+    key = (s, self._settings['simp'], self._settings['xor'])
+    res = self._parsed.get(key)
+    if res is None:
+      name, rhs = ASSIGN.match(s).groups()
+      ok, expr = self.sym._parse(rhs)
+      if not ok:
+        raise ValueError("%s: %s" % (name, expr))
+      res = (name, expr)
+      self._parsed.put(key, res, len(s))
+    return res
+
+  def update(self, lines):
+    """Read definitions from the lines, the parsing errors are saved in errors"""
+    settings = self.sym.getSettings()
+    if settings != self._settings:
+      self._settings = settings
+      self._defs, self._deps = {}, {}
+      self._resolved.clear()
+      self._printed.clear()
+    defs, self.errors = {}, []
+    for n, s in enumerate(lines, 1):
+      if not ASSIGN.match(s):
+        continue
+      try:
+        name, expr = self._parseLine(s)
+      except ValueError as err:
+        self.errors.append("line %d: %s" % (n, err))
+        continue
+      defs[name] = (n, s, expr)   # the last definition is used
+    changed = {k for k in set(defs) | set(self._defs)
+               if k not in defs or k not in self._defs or defs[k][2] != self._defs[k][2]}
+    deps = {k: {str(v) for v in e.free_symbols} & set(defs) for k, (_, _, e) in defs.items()}
+    # drop values of the changed names and all their dependents,
+    # links from the old definitions are taken into account too
+    users = {}
+    for graph in (self._deps, deps):
+      for k, used in graph.items():
+        for d in used:
+          users.setdefault(d, set()).add(k)
+    self._defs, self._deps = defs, deps
+    stack, seen = list(changed), set(changed)
+    while stack:
+      k = stack.pop()
+      self._resolved.pop(k, None)
+      self._printed.pop(k, None)
+      for u in users.get(k, ()):
+        if u not in seen:
+          seen.add(u)
+          stack.append(u)
+
+  def resolve(self, name):
+    """Expression for the name with all definitions substituted,
+    dependencies are resolved without recursion, so long chains are allowed"""
+    stack, path, active = [(name, False)], [], set()
+    while stack:
+      k, ready = stack.pop()
+      if ready:
+        # all the used names are resolved
+        active.discard(k)
+        path.pop()
+        self._resolved[k] = self._substitute(self._defs[k][2])
+        continue
+      if k in self._resolved:
+        continue
+      if k in active:
+        cycle = path[path.index(k):] + [k]
+        raise ValueError("Cyclic definition: %s" % ' -> '.join(cycle))
+      active.add(k)
+      path.append(k)
+      stack.append((k, True))
+      stack.extend((d, False) for d in self._deps[k] if d not in self._resolved)
+    return self._resolved[name]
+
+  def _substitute(self, expr):
+    """Replace defined symbols in the expression"""
+    rep = {}
+    for v in expr.free_symbols:
+      if str(v) in self._defs:
+        rep[v] = self.resolve(str(v))
+    return expr.xreplace(rep) if rep else expr
+
+  def expand(self, s):
+    """Substitute definitions into the string, the left part of assignment is kept"""
+    m = ASSIGN.match(s)
+    lhs, rhs = ('%s = ' % m.group(1), m.group(2)) if m else ('', s)
+    ok, expr = self.sym._parse(rhs)
+    if not ok:
+      return False, expr
+    try:
+      expr = self._substitute(expr)
+    except ValueError as err:
+      return False, err
+    return True, lhs + self.sym._print(expr)
+
+  def evaluate(self):
+    """All the resolved definitions as text"""
+    res = []
+    for name, (n, _, _) in sorted(self._defs.items(), key=lambda v: v[1][0]):
+      s = self._printed.get(name)
+      if s is None:
+        try:
+          s = '%s = %s' % (name, self.sym._print(self.resolve(name)))
+        except ValueError as err:
+          s = '%s: %s' % (name, err)
+        self._printed[name] = s
+      res.append(s)
+    return '\n'.join(res)
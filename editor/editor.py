@@ -3,28 +3,55 @@
 import tkinter as tk
 import tkinter.filedialog as filedialog
 import tkinter.messagebox as messagebox
+import os
 import hashlib
+import re
 
-from .dialogs import FindDlg, ReplaceDlg, GetParams
+from .dialogs import FindDlg, ReplaceDlg, GetParams, PerfWindow, TextWindow
 from .symbolic import Sym
+from .engine import Engine
+from .daemon import connect
+from .textview import TextView
+from .highlight import NumberHighlighter, BracketIndex
+from . import search
+from .fileio import FileLoader, saveText
+from .bigfile import LargeFile, BIG_FILE
+from .journal import Journal, journalPath, readJournal, replay
+from . import perf
+from .macro import Macros
+from .document import definitions
+from .store import ResultStore
+from .symbolic import formatOps, LruCache, OPERATIONS, BACKENDS, hasSymengine
 
 COLOR_NORM = 'white'
 COLOR_WARN = 'yellow'
 INIT_POW   = True
 INIT_EVAL  = False
+INIT_STORE = True
 TAG_SEL = 'selected'
 TAG_BR = 'bracket'
 TAG_NUM = 'number'
+TAG_UNBAL = 'unbalanced'
+TAG_FOLD = 'collapsed'
+MARK_BEG = 'job_begin'
+MARK_END = 'job_end'
+POLL_MS = 50
+BATCH_ERRORS = 20
+SELECT_DELAY = 150        # ms, wait for the end of selection
+VISIBLE_ONLY = 1 << 20    # for bigger text highlight only visible region
+PREVIEW_DELAY = 300       # ms, wait for the end of typing
+PREVIEW_TIMEOUT = 10      # s
+PREVIEW_CACHE = 256       # number of stored previews
+PREVIEW_PARSE = 'Parse'
+COLLAPSE_SIZE = 20000     # hide the rest of longer results
+COLLAPSE_HEAD = 2000      # visible part of the collapsed result
 
 ABOUT = \
 "TermIt v %s\n\n\
 Notepad for equations.\n\n\
 Wiki:\ngithub.com/mikhel1984/termit/wiki"
 
-BRACKETS = {'(': '[()]', '{': '[{}]', '[': '[\[\]]'}
-BRACKETS[')'] = BRACKETS['(']
-BRACKETS['}'] = BRACKETS['{']
-BRACKETS[']'] = BRACKETS['[']
+BRACKETS = '()[]{}'
 
 class Editor:
   """Create the main window"""
@@ -38,12 +65,30 @@ class Editor:
     self.sym = Sym()
     self.sym.simpParse(INIT_EVAL)
     self.sym.powXOR(INIT_POW)
+    self.sym.persist(INIT_STORE)
+    self.store = ResultStore()
+    # shared server if it is started, otherwise own worker processes
+    self.engine = connect() or Engine()
+    self.job = None
+    self.polling = False
+    self.journal = None       # autosave of the opened file
+    self.macros = Macros()
+    self.recording = None
+    # settings, shared by the menus
+    self.cb_eval = tk.BooleanVar(value=INIT_EVAL)
+    self.cb_pow = tk.BooleanVar(value=INIT_POW)
+    self.cb_lines = tk.BooleanVar(value=False)
+    self.cb_preview = tk.BooleanVar(value=False)
+    self.cb_cse = tk.BooleanVar(value=False)
+    self.cb_store = tk.BooleanVar(value=INIT_STORE)
+    self.var_backend = tk.StringVar(value='sympy')
     # editor
     self.editor = tk.Frame(root, width=600, height=400)
     self.editor.rowconfigure(0, weight=1)
     self.editor.columnconfigure(0, weight=1)
     self.editor.grid(row=1, column=0, sticky='news')
     self.textEditor(self.editor)
+    self.previewPane(self.editor)
     # bar
     self.bar = tk.Frame(root)
     self.bar.grid(row=0, column=0, sticky='we') 
@@ -51,17 +96,32 @@ class Editor:
     self.menuEdit(self.bar)
     self.menuSearch(self.bar)
     self.menuSympy(self.bar)
+    self.menuMacro(self.bar)
     self.menuHelp(self.bar)
     self.c_menu = self.createSympyMenu(self.text)
     self.text.bind('<ButtonRelease-3>', self.callContext)
     # status
+    self.statusBar = tk.Frame(root)
+    self.statusBar.columnconfigure(0, weight=1)
+    self.statusBar.grid(row=2, column=0, sticky='ew')
     self.statusVar = tk.StringVar()
-    self.status = tk.Label(root, textvariable=self.statusVar, bg=COLOR_NORM, relief='sunken')
-    self.status.grid(row=2, column=0, sticky='ew')
+    self.status = tk.Label(self.statusBar, textvariable=self.statusVar, bg=COLOR_NORM, relief='sunken')
+    self.status.grid(row=0, column=0, sticky='ew')
+    self.btnCancel = tk.Button(self.statusBar, text='Cancel', pady=0, command=self.cancelJob)
+    self.modVar = tk.StringVar()
+    self.lblModified = tk.Label(self.statusBar, textvariable=self.modVar, width=9, relief='sunken')
+    self.lblModified.grid(row=0, column=2)
     # evaluate
     self.editor_name = 'TermIt v.'+ver
+    self.fileName = None
+    self.fileState = None
+    self.loader = None
+    self.big = None           # large file mode
     self.text.focus_set()
-    self.root.title(self.editor_name)
+    self.text.bind('<<Modified>>', self._onModified)
+    self._setSaved()
+    # start sympy loading when the window is shown
+    self.root.after_idle(self._warmup)
     self.root.mainloop()
 
   def menuFile(self, frame):
@@ -108,6 +168,7 @@ class Editor:
     menu.add_separator()
     menu.add_command(label='Select all (Ctrl+A)', command=lambda: self.selAll(1))
     menu.add_command(label='Copy line (Ctrl+L)', command=lambda: self.copyLine(1))
+    menu.add_command(label='Show collapsed', command=self.showCollapsed)
     btn.configure(menu=menu)
     self.root.bind("<Control-a>", self.selAll)
     self.root.bind("<Control-l>", self.copyLine)
@@ -131,6 +192,7 @@ class Editor:
     basemenu.add_command(label='Subs..', 
       command=lambda: self._call_arg(self.sym.subs, 'Substitute', ('var','with')))
     basemenu.add_command(label='Evalf', command=lambda: self._call(self.sym.evalf))
+    basemenu.add_command(label='Evaluate over grid..', command=self.gridEval)
     menu.add_cascade(label='Base..', menu=basemenu)
     # rational
     ratmenu = tk.Menu(menu, tearoff=0)
@@ -154,62 +216,358 @@ class Editor:
     logmenu.add_command(label='Expand', command=lambda: self._call(self.sym.logExpand))
     logmenu.add_command(label='Combine', command=lambda: self._call(self.sym.logCombine))
     menu.add_cascade(label='Log..', menu=logmenu)
+    # definitions 'name = expr'
+    defmenu = tk.Menu(menu, tearoff=0)
+    defmenu.add_command(label='Expand definitions', command=self.defsExpand)
+    defmenu.add_command(label='Evaluate all', command=self.defsEvaluate)
+    menu.add_cascade(label='Definitions..', menu=defmenu)
     # settings
     setmenu = tk.Menu(menu, tearoff=0)
-    self.cb_eval = tk.BooleanVar()
-    self.cb_eval.set(INIT_EVAL)
     setmenu.add_checkbutton(label='Evaluate', variable=self.cb_eval, onvalue=True, 
         offvalue=False, command=lambda: self.sym.simpParse(self.cb_eval.get()))
-    self.cb_pow = tk.BooleanVar()
-    self.cb_pow.set(INIT_POW)
     setmenu.add_checkbutton(label='Power as ^', variable=self.cb_pow, onvalue=True,
         offvalue=False, command=lambda: self.sym.powXOR(self.cb_pow.get()))
+    setmenu.add_checkbutton(label='Compact (CSE)', variable=self.cb_cse, onvalue=True,
+        offvalue=False, command=lambda: self.sym.compact(self.cb_cse.get()))
+    setmenu.add_checkbutton(label='Each line', variable=self.cb_lines, onvalue=True,
+        offvalue=False)
+    setmenu.add_checkbutton(label='Preview', variable=self.cb_preview, onvalue=True,
+        offvalue=False, command=self.showPreview)
+    setmenu.add_checkbutton(label='Persistent cache', variable=self.cb_store, onvalue=True,
+        offvalue=False, command=lambda: self.sym.persist(self.cb_store.get()))
+    backmenu = tk.Menu(setmenu, tearoff=0)
+    for name in BACKENDS:
+      backmenu.add_radiobutton(label=name, value=name, variable=self.var_backend,
+          command=lambda: self.sym.setBackend(self.var_backend.get()))
+    if not hasSymengine():
+      backmenu.entryconfigure('symengine', state='disabled')
+    setmenu.add_cascade(label='Backend..', menu=backmenu)
     menu.add_cascade(label='Settings..', menu=setmenu)
+    # results on disk
+    cachemenu = tk.Menu(menu, tearoff=0)
+    cachemenu.add_command(label='Statistics', command=self.cacheInfo)
+    cachemenu.add_command(label='Clear', command=self.cacheClear)
+    menu.add_cascade(label='Cache..', menu=cachemenu)
     return menu
 
+  def menuMacro(self, frame):
+    """Define elements of the 'Macro' menu"""
+    btn = tk.Menubutton(frame, text='Macro', underline=0)
+    btn.grid(row=0, column=4, sticky='w')
+    self.macroMenu = tk.Menu(btn, tearoff=0, postcommand=self._fillMacroMenu)
+    self.macroDelMenu = tk.Menu(self.macroMenu, tearoff=0)
+    btn.configure(menu=self.macroMenu)
+
+  def _fillMacroMenu(self):
+    """Update list of macros"""
+    menu = self.macroMenu
+    menu.delete(0, 'end')
+    if self.recording is None:
+      menu.add_command(label='Record', command=self.macroRecord)
+    else:
+      menu.add_command(label='Stop recording (%d)' % len(self.recording), command=self.macroStop)
+    menu.add_command(label='Define..', command=self.macroDefine)
+    self.macroDelMenu.delete(0, 'end')
+    names = self.macros.names()
+    if names:
+      menu.add_separator()
+      for name in names:
+        menu.add_command(label=name, command=lambda n=name: self.macroRun(n))
+        self.macroDelMenu.add_command(label=name, command=lambda n=name: self.macros.remove(n))
+      menu.add_separator()
+      menu.add_cascade(label='Remove..', menu=self.macroDelMenu)
+
+  def macroRecord(self):
+    """Start recording of the Sympy operations"""
+    self.recording = []
+    self.INFO("Recording macro")
+
+  def macroStop(self):
+    """Finish recording and save the macro"""
+    ops, self.recording = self.recording, None
+    if not ops:
+      self.INFO("Nothing is recorded")
+      return
+    par = GetParams(self.root, "Save macro", ("Name",))
+    if par.pressok and par.v1:
+      self.macros.define(par.v1, formatOps(ops))
+      self.INFO("Macro %s: %s" % (par.v1, self.macros.spec(par.v1)))
+
+  def macroDefine(self):
+    """Write macro manually"""
+    par = GetParams(self.root, "Define macro", ("Name", "Operations"), ('', 'expand,collect:x'))
+    if not (par.pressok and par.v1 and par.v2):
+      return
+    try:
+      self.macros.define(par.v1, par.v2)
+    except ValueError as err:
+      self.WARN(str(err))
+
+  def macroRun(self, name):
+    """Apply macro to the selection, line or each line"""
+    rng = self._getRange()
+    self._submit('pipeline', rng, self.text.get(*rng), (self.macros.get(name),))
+
+  def _record(self):
+    """Save the finished operation to the macro"""
+    if self.recording is not None:
+      name, args = self.jobOp
+      if name == 'pipeline':
+        self.recording.extend(args[0])
+      elif name in OPERATIONS:
+        self.recording.append((name, args))
+
+  def cacheInfo(self):
+    """Show state of the persistent cache"""
+    st = self.store.stats()
+    messagebox.showinfo("Cache", "%s\n\nResults: %d\nSize: %.1f of %.1f MB" % (
+      st['path'], st['count'], st['size'] / 2**20, st['maxsize'] / 2**20))
+
+  def cacheClear(self):
+    """Remove all the results from the persistent cache"""
+    if messagebox.askyesno("Cache", "Remove all the stored results?"):
+      self.store.clear()
+      self.INFO("Cache is cleared")
+
+  def _definitions(self):
+    """Lines of the text with assignments"""
+    return definitions(self.text.content().split('\n'))
+
+  def defsExpand(self):
+    """Substitute definitions into the selection, line or each line"""
+    rng = self._getRange()
+    self._submit('defsExpand', rng, self.text.get(*rng), (self._definitions(),))
+
+  def defsEvaluate(self):
+    """Show values of all the definitions"""
+    if self.job is not None:
+      self.WARN("Wait for the previous operation or cancel it")
+      return
+    self.jobName = 'defsEvaluate'
+    jid = self.engine.submit('defsEvaluate', [''], (self._definitions(),),
+      self.sym.getSettings(), done=self._onDefsDone)
+    if self.engine.busy():
+      self.job = jid
+      self.INFO("Evaluate definitions...")
+      self.btnCancel.grid(row=0, column=1)
+      self._startPoll()
+
+  def _onDefsDone(self, results):
+    """Show the evaluated definitions"""
+    self.job = None
+    self.btnCancel.grid_remove()
+    ok, res = results[0]
+    if not ok:
+      self.WARN(res)
+    elif not res:
+      self.INFO("No definitions")
+    else:
+      TextWindow(self.root, "Definitions", res)
+      self.INFO("Done!")
+
   def menuHelp(self, frame):
     """Define elements of the 'Help' menu"""
     btn = tk.Menubutton(frame, text='Help', underline=0)
-    btn.grid(row=0, column=4, sticky='w')
+    btn.grid(row=0, column=5, sticky='w')
     menu = tk.Menu(btn, tearoff=0)
+    menu.add_command(label='Performance', command=lambda: PerfWindow(self.root))
     menu.add_command(label='About', 
       command=lambda: messagebox.showinfo("About", ABOUT % (self.version,)))
     btn.configure(menu=menu)
 
   def textEditor(self, frame):
     """Create text editor widget"""
-    self.text = tk.Text(frame, wrap='none', undo=True)
+    self.text = TextView(frame, wrap='none', undo=True)
     vscroll = tk.Scrollbar(frame, command=self.text.yview, orient='vertical')
     hscroll = tk.Scrollbar(frame, command=self.text.xview, orient='horizontal')
     self.text.configure(yscrollcommand=vscroll.set, xscrollcommand=hscroll.set)
+    self.vscroll = vscroll
     self.text.grid(row=0, column=0, sticky='nsew')
     vscroll.grid(row=0, column=1, sticky='ns')
     hscroll.grid(row=1, column=0, sticky='ew')
-    self.hashcode = self.getHash()
     # tags 
     self.text.tag_config(TAG_SEL, background="yellow")
     self.text.tag_config(TAG_BR, underline=True)
     self.text.tag_config(TAG_NUM, foreground='blue')
+    self._afterSelect = None
     self.text.bind('<<Selection>>', self._onSelect)
-    self.text.bind('<KeyRelease>', self.checkNumber)
+    self.text.tag_config(TAG_UNBAL, background='pink')
+    self.text.tag_config(TAG_FOLD, elide=True)
+    self.numbers = NumberHighlighter(self.text, TAG_NUM)
+    self.brackets = BracketIndex(self.text, TAG_UNBAL)
+    self.text.addEditListener(self._onEdit)
+
+  def previewPane(self, frame):
+    """Create widgets to show result for the current line"""
+    self.preview = tk.Frame(frame)
+    self.preview.columnconfigure(1, weight=1)
+    self.previewOp = tk.StringVar(value=PREVIEW_PARSE)
+    ops = [PREVIEW_PARSE] + [k for k, n in OPERATIONS.items() if n == 0]
+    opt = tk.OptionMenu(self.preview, self.previewOp, *ops, command=lambda v: self._onPreviewEdit(None))
+    opt.grid(row=0, column=0, sticky='w')
+    self.previewVar = tk.StringVar()
+    self.previewLbl = tk.Entry(self.preview, textvariable=self.previewVar, state='readonly', relief='flat')
+    self.previewLbl.grid(row=0, column=1, sticky='ew')
+    self.previewCache = LruCache(PREVIEW_CACHE, PREVIEW_CACHE << 12)
+    self.previewJob = None
+    self.previewKey = None
+    self._afterPreview = None
+    # cursor motion and all the text changes
+    for ev in ('<KeyRelease>', '<ButtonRelease-1>'):
+      self.text.bind(ev, self._onPreviewEdit, add='+')
+    self.text.addListener(lambda line, nold, nnew: self._onPreviewEdit(None))
+
+  def showPreview(self):
+    """Switch preview pane"""
+    if self.cb_preview.get():
+      self.preview.grid(row=2, column=0, columnspan=2, sticky='ew')
+      self._onPreviewEdit(None)
+    else:
+      self.preview.grid_remove()
+      self._cancelPreview()
 
-  def getHash(self):
-    """Find hash code for the text"""
-    txt = self.text.get('1.0', 'end') 
-    return hashlib.md5(txt.encode()).hexdigest()
+  def _onPreviewEdit(self, ev):
+    """Update preview when the typing is paused"""
+    if not self.cb_preview.get():
+      return
+    if self._afterPreview is not None:
+      self.text.after_cancel(self._afterPreview)
+    self._afterPreview = self.text.after(PREVIEW_DELAY, self._updatePreview)
+
+  def _cancelPreview(self):
+    """Forget the running evaluation"""
+    if self.previewJob is not None:
+      # don't kill the worker, it can be reused by the next request
+      self.engine.cancel(self.previewJob, kill=False)
+      self.previewJob = None
+
+  def _updatePreview(self):
+    """Evaluate the current line or selection in background"""
+    self._afterPreview = None
+    rng = self.text.tag_ranges('sel')
+    if not rng:
+      rng = ('insert linestart', 'insert lineend')
+    s = self.text.get(*rng)
+    op = self.previewOp.get()
+    key = (s, op, tuple(sorted(self.sym.getSettings().items())))
+    if key == self.previewKey:
+      return    # in progress or shown
+    self._cancelPreview()
+    self.previewKey = key
+    if not s.strip():
+      self._showPreview((True, ''))
+      return
+    res = self.previewCache.get(key)
+    if res is not None:
+      self._showPreview(res)
+      return
+    name, args = ('pipeline', ((),)) if op == PREVIEW_PARSE else (op, ())
+    self.previewJob = self.engine.submit(name, [s], args, self.sym.getSettings(),
+      PREVIEW_TIMEOUT, done=lambda r: self._onPreviewDone(key, r[0]), urgent=True)
+    self._startPoll()
+
+  def _onPreviewDone(self, key, res):
+    """Save and show the evaluated preview"""
+    self.previewJob = None
+    self.previewCache.put(key, res, len(res[1]))
+    if key == self.previewKey:
+      self._showPreview(res)
+
+  def _showPreview(self, res):
+    """Update text of the preview"""
+    ok, s = res
+    self.previewLbl.configure(readonlybackground=COLOR_NORM if ok else COLOR_WARN)
+    self.previewVar.set(s)
+
+  def isModified(self):
+    """Check if the text is changed after the last saving"""
+    return bool(self.text.edit_modified()) or (self.big is not None and self.big.modified)
+
+  def _onModified(self, ev):
+    """Update title and status when the modified flag is changed"""
+    mod = self.isModified()
+    self.root.title(('*' if mod else '') + (self.fileName or self.editor_name))
+    self.modVar.set('Modified' if mod else '')
+
+  def _setSaved(self, name=None, digest=None):
+    """Mark the text as saved to the file"""
+    self.fileName = name
+    self.fileState = None
+    if name is not None:
+      try:
+        st = os.stat(name)
+      except OSError as err:
+        self.WARN(str(err))   # changes on disk are not detected
+      else:
+        self.fileState = (st.st_mtime_ns, st.st_size, digest)
+    self.text.edit_modified(False)
+    self._onModified(None)
+
+  def _diskChanged(self):
+    """Check if the opened file is modified by other program"""
+    if self.fileState is None:
+      return False
+    try:
+      st = os.stat(self.fileName)
+    except OSError:
+      return False
+    mtime, size, digest = self.fileState
+    if (st.st_mtime_ns, st.st_size) == (mtime, size):
+      return False
+    # compare content only when the file attributes differ
+    md5 = hashlib.md5()
+    with open(self.fileName, 'rb') as f:
+      for chunk in iter(lambda: f.read(1 << 20), b''):
+        md5.update(chunk)
+    return md5.hexdigest() != digest
+
+  def _onEdit(self, *op):
+    """Save text operation to the journal"""
+    if self.journal is not None:
+      self.journal.record(*op)
+
+  def _startJournal(self, name, digest, recover=True):
+    """Begin autosave of the file changes, offer to restore
+    the changes which were not saved before the crash"""
+    self._stopJournal(remove=False)
+    if self.big is not None:
+      return    # the widget contains only part of the file
+    path = journalPath(name)
+    old = readJournal(path)
+    journal = Journal(self.text, path)
+    try:
+      if recover and old is not None and old[0] == digest and old[1] and \
+          messagebox.askyesno("Recovery", "Restore unsaved changes of %s?" % name):
+        replay(self.text, old[1])
+        journal.resume(digest)
+        self.text.edit_modified(True)
+        self.INFO("Restored %s" % name)
+      else:
+        journal.start(digest)
+    except OSError as err:
+      self.WARN("Autosave: %s" % err)
+      return
+    self.journal = journal
+
+  def _stopJournal(self, remove=True):
+    """Finish autosave, remove the journal if the changes are saved or discarded"""
+    if self.journal is not None:
+      self.journal.close(remove)
+      self.journal = None
 
   def checkChanges(self, ev, msg):
     """Provide menu to save changes if need"""
-    if self.hashcode != self.getHash():
+    if self.isModified():
       if tk.messagebox.askyesno(msg, "Save changes?"):
-        self.fileSave()
+        self.fileSave(ev)
 
   def fileNew(self, ev):
     """Command to create new empty file"""
     self.checkChanges(ev, "New file")
+    self._stopJournal()
+    self._stopLoading()
     self.text.delete('1.0', 'end')
-    self.root.title(self.editor_name)
-    self.hashcode = self.getHash()
+    self._setSaved()
 
   def fileOpen(self, ev):
     """Command to open an existing file"""
@@ -217,36 +575,103 @@ class Editor:
     name = filedialog.Open(self.root, filetypes = [('All files', '*')]).show()
     if type(name) != str or name == '':
       return
+    self._stopJournal()
+    self._stopLoading()
+    self.text.delete('1.0', 'end')
+    self._setSaved()
+    try:
+      if os.path.getsize(name) > BIG_FILE:
+        self.big = LargeFile(self.text, self.vscroll, name, self._onLoading,
+          lambda digest: self._onLoaded(name, digest), lambda: self.job is not None)
+        self.big.start()
+        return
+      self.loader = FileLoader(self.text, name, self._onLoading,
+        lambda digest: self._onLoaded(name, digest), lambda msg: self._onLoadFailed(name, msg))
+    except OSError as err:
+      self.WARN(str(err))
+      return
+    self.loader.start()
+
+  def _onLoading(self, pos, size):
+    """Show progress of the file reading"""
+    if size:
+      self.INFO("Loading %d%%" % (100 * pos // size))
+
+  def _onLoaded(self, name, digest):
+    """File reading is finished"""
+    self.loader = None
+    self.text.mark_set('insert', '1.0')
+    self._setSaved(name, digest)
+    if self.big is not None:
+      self.INFO("Loaded %s, large file mode: %d lines" % (name, self.big.lineCount()))
+    else:
+      self.INFO("Loaded %s" % name)
+      self._startJournal(name, digest)
+
+  def _onLoadFailed(self, name, msg):
+    """File cannot be shown without changes"""
+    self.loader = None
     self.text.delete('1.0', 'end')
-    self.text.insert('1.0', open(name, 'rt').read())
-    self.root.title(name)
-    self.hashcode = self.getHash()
-    self.checkRangeNumbers('1.0', 'end')
+    self._setSaved()
+    self.WARN("Cannot open %s: %s" % (name, msg))
+
+  def _stopLoading(self):
+    """Cancel reading of the previous file"""
+    if self.loader is not None:
+      self.loader.cancel()
+      self.loader = None
+    if self.big is not None:
+      self.big.close()
+      self.big = None
+
+  def _isLoading(self):
+    """Check if the file is not read completely"""
+    return self.loader is not None or (self.big is not None and self.big.table is None)
+
+  def _write(self, name):
+    """Save text to the file"""
+    try:
+      if self.big is not None:
+        digest = self.big.save(name)
+      else:
+        digest = saveText(self.text, name)
+    except (OSError, UnicodeError) as err:
+      self.WARN(str(err))
+      return
+    old = self.fileName
+    self._setSaved(name, digest)
+    self.INFO("Saved")
+    if old != name:
+      self._stopJournal()    # the changes are in the file
+    self._startJournal(name, digest, recover=False)
 
   def fileSaveAs(self, ev):
     """Command to save the text as a new file"""
+    if self._isLoading():
+      return
     name = filedialog.SaveAs(self.root, filetypes = [('All files','*')]).show()
-    if name == '':
+    if type(name) != str or name == '':
       return
-    open(name, 'wt').write(self.text.get('1.0', 'end'))
-    self.root.title(name)
-    self.hashcode = self.getHash()
+    self._write(name)
 
   def fileSave(self, ev):
     """Command to save changes in the text"""
-    if self.hashcode == self.getHash(): 
+    if self._isLoading():
+      return    # not finished
+    if not self.isModified() and self.fileName is not None: 
       return    # no changes
-    name = self.root.title()
-    if name == self.editor_name:
+    if self.fileName is None:
       self.fileSaveAs(ev)
-    else:
-      open(name, 'wt').write(self.text.get('1.0', 'end'))
-      self.root.title(name)
-      self.hashcode = self.getHash()
+    elif not self._diskChanged() or \
+        tk.messagebox.askyesno("Save", "File is changed on disk. Overwrite?"):
+      self._write(self.fileName)
 
   def fileQuit(self, ev):
     """Command to quit the program"""
     self.checkChanges(ev, "Quit")
+    self._stopJournal()
+    self._stopLoading()
+    self.engine.close()
     self.root.destroy()
 
   def searchFind(self, ev):
@@ -278,73 +703,89 @@ class Editor:
   def searchFindReplace(self, ev):
     """Command to open menu to find and replace the text"""
     # TODO: save state
-    dlg = ReplaceDlg(self.root, "Find and replace", "", "") 
+    dlg = ReplaceDlg(self.root, "Find and replace", "", "", self._countMatches) 
     if dlg.pressok and dlg.find and dlg.replace:
+      try:
+        pattern = search.makePattern(dlg.find, dlg.nocase, dlg.regex, dlg.word)
+      except re.error as err:
+        self.WARN("Wrong pattern: %s" % err)
+        return
       self.text.selection_clear()
-      i_from = '1.0' if dlg.all else 'insert + 1 chars'
-      while True:
-        # find
-        i_from = self.text.search(dlg.find, i_from, nocase=dlg.nocase)
-        if not i_from: break
-        i_to = '%s + %d c' % (i_from, len(dlg.find))
-        # replace
-        self.text.delete(i_from, i_to)
-        self.text.insert(i_from, dlg.replace)
-        # break if need
-        if dlg.all:
-          i_from = '%s + %d c' % (i_from, len(dlg.replace))
-        else:
-          break
+      txt = self.text.content()
+      try:
+        with perf.span('search.replace'):
+          if dlg.all:
+            res = search.replaceAll(txt, pattern, dlg.replace, dlg.regex)
+          else:
+            pos = self.text.indexOffset('insert') + 1
+            res = search.replaceNext(txt, pattern, dlg.replace, pos, dlg.regex)
+      except re.error as err:
+        self.WARN("Wrong replacement: %s" % err)
+        return
+      if res is None:
+        self.INFO("Not found")
+        return
+      beg, end, snext, n = res
+      i_from = self.text.offsetIndex(beg)
+      self._replaceRange(i_from, self.text.offsetIndex(end), snext)
+      self.text.mark_set('insert', i_from)
+      self.INFO("Replaced %d" % n)
+
+  def _countMatches(self, find, nocase, regex, word):
+    """Get number of matches for the replace dialog"""
+    if not find:
+      return ""
+    try:
+      pattern = search.makePattern(find, nocase, regex, word)
+    except re.error as err:
+      return "Wrong pattern: %s" % err
+    return "%d matches" % search.countMatches(self.text.content(), pattern)
 
   def _onSelect(self, ev):
+    """Highlight parts of text when the selection is stable"""
+    if self._afterSelect is not None:
+      self.text.after_cancel(self._afterSelect)
+    self._afterSelect = self.text.after(SELECT_DELAY, self._showSelected)
+
+  def _showSelected(self):
     """Highlight parts of text"""
+    self._afterSelect = None
     self.text.tag_remove(TAG_SEL, '1.0', 'end')
     rng = self.text.tag_ranges('sel')
     if rng:
-      sel = self.text.selection_get()
-      if len(sel) == 1 and BRACKETS.get(sel) is not None:
+      sel = self.text.get(*rng)
+      if len(sel) == 1 and sel in BRACKETS:
         self.text.tag_remove(TAG_BR, '1.0', 'end')
         self._highlightBrackets(sel, self.text.index(rng[1]))
       else:
-        self._highlightFound(sel, rng)
-
-  def _findPairBracket(self, br, ind):
-    """Find pair for the given bracket"""
-    fwd = (br in ('(','[','{'))
-    stop = 'end' if fwd else '1.0'
-    increment = '+ 1c' if fwd else '- 1c'
-    templ = BRACKETS[br]
-    count = 1
-    while count != 0:
-      ind = self.text.search(templ, ind + increment, stopindex=stop, regexp=True, forwards=fwd, backwards=(not fwd))
-      if not ind: break
-      v = self.text.get(ind)
-      if v == br:
-        count += 1
-      else:
-        count -= 1
-    return ind, count
-    
+        with perf.span('highlight.found'):
+          self._highlightFound(sel, rng)
+
   def _highlightBrackets(self, br, pos):
     """Show brackets"""
-    pos2, cnt = self._findPairBracket(br, pos)
-    if cnt == 0:
-      self.text.tag_add(TAG_BR, pos+'- 1c', pos)
-      self.text.tag_add(TAG_BR, pos2, pos2+'+ 1c')
-      
+    line, col = map(int, self.text.index(pos + '- 1c').split('.'))
+    pair = self.brackets.pair(line, col)
+    if pair is not None:
+      self.text.tag_add(TAG_BR, '%d.%d' % (line, col), '%d.%d' % (line, col+1))
+      self.text.tag_add(TAG_BR, '%d.%d' % pair, '%d.%d' % (pair[0], pair[1]+1))
+
   def _highlightFound(self, sel, rng):
     """Show similar text"""
-    i_from = '1.0'
-    while True:
-      i_from = self.text.search(sel, i_from, stopindex='end') 
-      if not i_from: break
-      if self.text.compare(i_from, '==', rng[0]):
-        # skip the selected text
-        i_from = '%s + %d c' % (i_from, len(sel))
-        continue
-      i_to = "%s + %d c" % (i_from, len(sel))
-      self.text.tag_add(TAG_SEL, i_from, i_to)
-      i_from = '%s + %d c' % (i_from, len(sel))
+    txt = self.text.content()
+    beg, end = 0, len(txt)
+    if end > VISIBLE_ONLY:
+      # visible lines only
+      beg = self.text.indexOffset('@0,0 linestart')
+      end = self.text.indexOffset('@0,%d lineend' % self.text.winfo_height())
+    skip = self.text.indexOffset(rng[0])
+    indices = []
+    i = txt.find(sel, beg, end)
+    while i >= 0:
+      if i != skip:
+        indices.append(self.text.offsetIndex(i))
+        indices.append(self.text.offsetIndex(i + len(sel)))
+      i = txt.find(sel, i + len(sel), end)
+    self.text.tagAddAll(TAG_SEL, indices)
 
   def selAll(self, ev):
     """Select all text"""
@@ -367,45 +808,202 @@ class Editor:
 
   def _call(self,fn):
     """Get the selected text and apply function"""
-    rng = self.text.tag_ranges('sel')
-    if not rng:
-      # whole line
-      rng = (self.text.index('insert linestart'), self.text.index('insert lineend'))
+    rng = self._getRange()
     s = self.text.get(*rng)
     # execute 
-    ok, snext = fn(s)
-    if ok:
-      self.text.delete(*rng)
-      self.text.insert(rng[0], snext) 
-      self.INFO("Done!")
-    else:
-      self.WARN(snext)
+    self._submit(fn.__name__, rng, s)
 
   def _call_arg(self,fn,title,tips,init=('','')):
     """Get the selected text, call menu for additional parameters and apply function"""
-    rng = self.text.tag_ranges('sel')
-    if not rng:
-      # whole line
-      rng = (self.text.index('insert linestart'), self.text.index('insert lineend'))
+    rng = self._getRange()
     s = self.text.get(*rng)
     # call dialog
-    ok, snext = False, ""
     par = GetParams(self.root, title, tips, init)
     if len(tips) == 1: 
       if not (par.pressok and par.v1): 
         return
-      ok, snext = fn(s, par.v1)
+      args = (par.v1,)
     else:      # len(tips) == 2
       if not (par.pressok and par.v1 and par.v2):
         return
-      ok, snext = fn(s, par.v1, par.v2)
-    # update text
-    if ok:
-      self.text.delete(*rng)
-      self.text.insert(rng[0], snext) 
-      self.INFO("Done!")
+      args = (par.v1, par.v2)
+    self._submit(fn.__name__, rng, s, args)
+
+  def gridEval(self):
+    """Evaluate the expression for ranges of its variables"""
+    rng = self._getRange()
+    s = self.text.get(*rng)
+    par = GetParams(self.root, "Evaluate over grid", ("Ranges", "CSV file"), ('x=0:1:11', ''))
+    if not (par.pressok and par.v1):
+      return
+    if par.v2 and self.cb_lines.get():
+      self.WARN("CSV is saved for a single expression only")
+      return
+    self._submit('grid', rng, s, (par.v1, par.v2))
+
+  def _getRange(self):
+    """Selected region, the current line or the whole text in 'each line' mode"""
+    rng = self.text.tag_ranges('sel')
+    if rng:
+      return tuple(str(i) for i in rng)
+    if self.cb_lines.get():
+      # whole text
+      return (self.text.index('1.0'), self.text.index('end - 1c'))
+    # whole line
+    return (self.text.index('insert linestart'), self.text.index('insert lineend'))
+
+  def _submit(self, name, rng, s, args=()):
+    """Send the operation to the background engine"""
+    if self.job is not None:
+      self.WARN("Wait for the previous operation or cancel it")
+      return
+    gen = self.text.generation
+    if not self.cb_lines.get():
+      bad = self.brackets.check(*rng)
+      if bad is not None:
+        self.WARN("Unbalanced bracket at %s" % bad)
+        return
+    # marks follow the region while the text is changed
+    self.text.mark_set(MARK_BEG, rng[0])
+    self.text.mark_gravity(MARK_BEG, 'left')
+    self.text.mark_set(MARK_END, rng[1])
+    self.text.mark_gravity(MARK_END, 'right')
+    if self.cb_lines.get():
+      # apply to each non-empty line
+      lines = s.split('\n')
+      pos = [i for i, v in enumerate(lines) if v.strip()]
+      if not pos:
+        self.INFO("Nothing to evaluate")
+        return
+      items = [lines[i] for i in pos]
+      done = lambda res: self._onBatchDone(s, gen, lines, pos, res)
     else:
+      items = [s]
+      done = lambda res: self._onDone(s, gen, res[0])
+    self.jobName = name
+    self.jobOp = (name, args)
+    # single expression is waited interactively, 'each line' is a batch
+    jid = self.engine.submit(name, items, args, self.sym.getSettings(), done=done,
+      urgent=not self.cb_lines.get())
+    if self.engine.progress(jid)[1]:
+      # not finished yet, other jobs (preview) do not block the operations
+      self.job = jid
+      self.INFO("Evaluate %s..." % name)
+      self.btnCancel.grid(row=0, column=1)
+      self._startPoll()
+
+  def _startPoll(self):
+    """Begin checking of the background engine"""
+    if not self.polling:
+      self.polling = True
+      self.root.after(POLL_MS, self._poll)
+
+  def _poll(self):
+    """Check the background operation state"""
+    if self.engine.poll():
+      if self.job is not None:
+        n, total = self.engine.progress(self.job)
+        if total > 1:
+          self.INFO("Evaluate %s: %d/%d" % (self.jobName, n, total))
+      self.root.after(POLL_MS, self._poll)
+    else:
+      self.polling = False
+
+  def _warmup(self):
+    """Load sympy in the worker process"""
+    self.INFO("Loading engine...")
+    self.engine.submit('version', [''], done=self._onWarmup)
+    self._startPoll()
+
+  def _onWarmup(self, results):
+    """Worker is ready"""
+    ok, ver = results[0]
+    if self.job is None and not self._isLoading():
+      if ok:
+        self.INFO("Sympy %s" % ver)
+      else:
+        self.WARN(ver)
+
+  def _isStale(self, s, gen):
+    """Check if the processed region is edited"""
+    return gen != self.text.generation and self.text.get(MARK_BEG, MARK_END) != s
+
+  def _onDone(self, s, gen, result):
+    """Update text when the operation is finished"""
+    self.job = None
+    self.btnCancel.grid_remove()
+    ok, snext = result
+    if not ok:
       self.WARN(snext)
+    elif self._isStale(s, gen):
+      # the region was edited
+      self.WARN("Text is changed, result is ignored")
+    else:
+      self._replaceRange(MARK_BEG, MARK_END, snext)
+      self._record()
+      if self._collapse(MARK_BEG, snext):
+        self.INFO("Done! Long result is collapsed, see Edit > Show collapsed")
+      else:
+        self.INFO("Done!")
+
+  def _onBatchDone(self, s, gen, lines, pos, results):
+    """Update all processed lines in one step"""
+    self.job = None
+    self.btnCancel.grid_remove()
+    if self._isStale(s, gen):
+      self.WARN("Text is changed, result is ignored")
+      return
+    errors = []
+    first = int(self.text.index(MARK_BEG).split('.')[0])
+    for i, (ok, snext) in zip(pos, results):
+      if ok:
+        lines[i] = snext
+      else:
+        errors.append("line %d: %s" % (first + i, snext))
+    if len(errors) < len(pos):
+      self._replaceRange(MARK_BEG, MARK_END, '\n'.join(lines))
+      self._record()
+      off = 0
+      for v in lines:
+        self._collapse('%s + %d c' % (MARK_BEG, off), v)
+        off += len(v) + 1
+    if errors:
+      msg = "Failed %d of %d lines" % (len(errors), len(pos))
+      self.WARN(msg)
+      if len(errors) > BATCH_ERRORS:
+        errors = errors[:BATCH_ERRORS] + ['...']
+      messagebox.showwarning("Each line", msg + '\n\n' + '\n'.join(errors))
+    else:
+      self.INFO("Done %d lines!" % len(pos))
+
+  def _replaceRange(self, beg, end, s):
+    """Replace text as a single undo step"""
+    with perf.span('editor.replace'):
+      self.text.configure(autoseparators=False)
+      self.text.edit_separator()
+      self.text.delete(beg, end)
+      self.text.insert(beg, s)
+      self.text.edit_separator()
+      self.text.configure(autoseparators=True)
+
+  def _collapse(self, beg, s):
+    """Hide the tail of too long inserted string, return True if hidden"""
+    if len(s) <= COLLAPSE_SIZE:
+      return False
+    self.text.tag_add(TAG_FOLD, '%s + %d c' % (beg, COLLAPSE_HEAD), '%s + %d c' % (beg, len(s)))
+    return True
+
+  def showCollapsed(self):
+    """Make all the hidden text visible"""
+    self.text.tag_remove(TAG_FOLD, '1.0', 'end')
+
+  def cancelJob(self):
+    """Stop the current background operation"""
+    if self.job is not None:
+      self.engine.cancel(self.job)
+      self.job = None
+    self.btnCancel.grid_remove()
+    self.INFO("Cancelled")
 
   def copyLine(self, ev):
     """Copy and past current line"""
@@ -413,21 +1011,3 @@ class Editor:
     rng = (i_from, self.text.index('insert lineend'))
     s = self.text.get(*rng)
     self.text.insert(i_from, s + '\n')
-    
-  def checkNumber(self, ev):
-    """Highlight numbers"""
-    # TODO check number in local region
-    i_beg = self.text.index('insert linestart')
-    i_end = self.text.index('insert lineend')
-    self.checkRangeNumbers(i_beg, i_end)
-
-  def checkRangeNumbers(self, i_beg, i_end):
-    count = tk.IntVar()
-    while True:
-      # TODO correct number pattern
-      i_beg = self.text.search('\d+\.?\d*', i_beg, stopindex=i_end, regexp=True, count=count)
-      if i_beg == '' or count.get() == 0: break
-      i_to = '%s + %d c' % (i_beg, count.get())
-      self.text.tag_add(TAG_NUM, i_beg, i_to)
-      i_beg = i_to
-
@@ -0,0 +1,229 @@
+# Background execution of the symbolical operations
+# in a pool of worker processes
+
+import os
+import time
+import itertools
+import collections
+import multiprocessing as mp
+
+from .symbolic import Sym
+from . import perf
+
+TIMEOUT = 60    # default time limit for a single operation, s
+
+def _serve(conn):
+  """Worker loop: receive tasks, apply Sym methods, send results"""
+  sym = Sym()
+  while True:
+    try:
+      msg = conn.recv()
+    except (EOFError, OSError):
+      break
+    if msg is None:
+      break
+    tid, name, s, args, settings = msg
+    try:
+      sym.setSettings(settings)
+      with perf.profile(name):
+        ok, res = getattr(sym, name)(s, *args)
+    except Exception as err:
+      ok, res = False, err
+    try:
+      conn.send((tid, ok, res if ok else str(res), perf.drain()))
+    except (EOFError, OSError):
+      break
+
+
+class _Slot:
+  """Worker process and its current task"""
+
+  def __init__(self, ctx):
+    self.conn, child = ctx.Pipe()
+    self.proc = ctx.Process(target=_serve, args=(child,), daemon=True)
+    self.proc.start()
+    child.close()
+    self.task = None
+    self.deadline = None
+
+  def run(self, task):
+    """Send task to the worker"""
+    self.task = task
+    self.started = time.perf_counter()
+    self.deadline = time.monotonic() + task.timeout
+    self.conn.send((task.tid, task.name, task.s, task.args, task.settings))
+
+  def stop(self):
+    """Kill the worker process"""
+    self.conn.close()
+    if self.proc.is_alive():
+      self.proc.terminate()
+    self.proc.join(1)
+
+
+class _Task:
+  """Single string to process"""
+
+  def __init__(self, tid, job, pos, name, s, args, settings, timeout):
+    self.tid = tid
+    self.job = job
+    self.pos = pos
+    self.name = name
+    self.s = s
+    self.args = args
+    self.settings = settings
+    self.timeout = timeout
+
+
+class _Job:
+  """Group of tasks with common callback"""
+
+  def __init__(self, jid, n, done):
+    self.jid = jid
+    self.results = [None] * n
+    self.left = n
+    self.done = done
+
+
+class Engine:
+  """Pool of processes for the symbolical operations"""
+
+  def __init__(self, nproc=None, timeout=TIMEOUT):
+    self.nproc = nproc or os.cpu_count() or 1
+    self.timeout = timeout
+    # 'fork' is not safe for the process with Tk
+    self._ctx = mp.get_context('spawn')
+    self._slots = []
+    self._queue = collections.deque()
+    self._jobs = {}
+    self._ids = itertools.count(1)
+
+  def submit(self, name, items, args=(), settings=None, timeout=None, done=None, urgent=False):
+    """Apply Sym method to each string from items, return job id.
+    done(results) is called from poll() with the list of (ok, res) pairs.
+    Urgent (interactive) jobs are started before the waiting ones."""
+    jid = next(self._ids)
+    job = _Job(jid, len(items), done)
+    self._jobs[jid] = job
+    settings = settings or Sym().getSettings()
+    timeout = timeout or self.timeout
+    tasks = [_Task(next(self._ids), job, pos, name, s, args, settings, timeout)
+             for pos, s in enumerate(items)]
+    if urgent:
+      self._queue.extendleft(reversed(tasks))
+    else:
+      self._queue.extend(tasks)
+    if not items:
+      self._finish(job)
+    self._dispatch()
+    return jid
+
+  def cancel(self, jid=None, kill=True):
+    """Stop the job, or all jobs if jid is None. When kill is False
+    the running tasks are finished, but their results are ignored."""
+    if jid is None:
+      jobs = set(self._jobs)
+    elif jid in self._jobs:
+      jobs = {jid}
+    else:
+      return False
+    self._queue = collections.deque(
+      t for t in self._queue if t.job.jid not in jobs)
+    for slot in list(self._slots):
+      if kill and slot.task is not None and slot.task.job.jid in jobs:
+        self._drop(slot)
+    for j in jobs:
+      del self._jobs[j]
+    return True
+
+  def busy(self):
+    """Check if there are unfinished jobs"""
+    return bool(self._jobs)
+
+  def progress(self, jid):
+    """Get number of processed and total tasks"""
+    job = self._jobs.get(jid)
+    if job is None:
+      return 0, 0
+    n = len(job.results)
+    return n - job.left, n
+
+  def poll(self):
+    """Collect results and check time limits, return True if busy.
+    Must be called periodically, e.g. with root.after."""
+    now = time.monotonic()
+    for slot in list(self._slots):
+      if slot.task is None:
+        continue
+      try:
+        ready = slot.conn.poll()
+      except (EOFError, OSError):
+        ready = False
+      if ready:
+        try:
+          tid, ok, res, spans = slot.conn.recv()
+        except (EOFError, OSError):
+          self._fail(slot, "Worker process is terminated")
+          continue
+        task, slot.task = slot.task, None
+        perf.record(spans)
+        perf.add('engine.' + task.name, slot.started, time.perf_counter() - slot.started)
+        if tid == task.tid:
+          self._store(task, ok, res)
+      elif not slot.proc.is_alive():
+        self._fail(slot, "Worker process is terminated")
+      elif now > slot.deadline:
+        self._fail(slot, "Timeout (%d s)" % slot.task.timeout)
+    self._dispatch()
+    return self.busy()
+
+  def close(self):
+    """Stop all the processes"""
+    self._queue.clear()
+    self._jobs.clear()
+    for slot in self._slots:
+      try:
+        slot.conn.send(None)
+      except (EOFError, OSError):
+        pass
+      slot.stop()
+    self._slots.clear()
+
+  def _dispatch(self):
+    """Send waiting tasks to free workers"""
+    for slot in self._slots:
+      if not self._queue:
+        return
+      if slot.task is None:
+        slot.run(self._queue.popleft())
+    while self._queue and len(self._slots) < self.nproc:
+      slot = _Slot(self._ctx)
+      self._slots.append(slot)
+      slot.run(self._queue.popleft())
+
+  def _drop(self, slot):
+    """Remove the slot with its process"""
+    slot.stop()
+    self._slots.remove(slot)
+
+  def _fail(self, slot, msg):
+    """Finish the current task of the slot with error"""
+    task = slot.task
+    self._drop(slot)
+    self._store(task, False, msg)
+
+  def _store(self, task, ok, res):
+    """Save result of the task"""
+    job = task.job
+    if job.jid not in self._jobs:
+      return   # cancelled
+    job.results[task.pos] = (ok, res)
+    job.left -= 1
+    if job.left == 0:
+      self._finish(job)
+
+  def _finish(self, job):
+    """Call the job callback"""
+    del self._jobs[job.jid]
+    if job.done is not None:
+      job.done(job.results)
@@ -0,0 +1,227 @@
+# Parser for the common subset of expressions: numbers, symbols,
+# + - * / ^ **, brackets and elementary functions. It builds the same
+# objects as sympy parse_expr with standard transformations, but
+# without tokenizing, code generation and eval.
+
+import re
+import keyword
+import builtins
+
+from .symbolic import sympy
+
+# functions which get evaluate=False from parse_expr
+FUNCTIONS = (
+  'sin', 'cos', 'tan', 'cot', 'sec', 'csc',
+  'asin', 'acos', 'atan', 'acot', 'asec', 'acsc',
+  'sinh', 'cosh', 'tanh', 'coth', 'sech', 'csch',
+  'asinh', 'acosh', 'atanh', 'acoth', 'asech', 'acsch',
+  'exp', 'log', 'ln', 'sqrt', 'cbrt',
+  'Abs', 're', 'im', 'sign', 'arg', 'conjugate',
+)
+CONSTANTS = ('pi', 'E', 'I', 'oo')
+
+TOKEN = re.compile(r'''\s*(?:
+  (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|
+  (?P<name>[A-Za-z_]\w*)|
+  (?P<op>\*\*|[-+*/^(),])
+)''', re.VERBOSE | re.ASCII)
+
+class Unsupported(Exception):
+  """Input must be processed by parse_expr"""
+
+_reserved = None
+
+def _reservedNames():
+  """Names which are not converted to symbols by parse_expr"""
+  global _reserved
+  if _reserved is None:
+    ns = {}
+    exec('from sympy import *', ns)
+    ns.update((k, v) for k, v in vars(builtins).items() if callable(v))
+    keep = (sympy.Basic, type, type(sympy.Q))   # Q is AssumptionKeys
+    _reserved = {k for k, v in ns.items() if isinstance(v, keep) or callable(v)}
+    _reserved.update(keyword.kwlist)
+    _reserved.update(('True', 'False', 'None'))
+  return _reserved
+
+def _tokens(s):
+  """List of (kind, value), raise Unsupported for other symbols"""
+  if '\n' in s:
+    raise Unsupported()
+  res, pos, n = [], 0, len(s)
+  while pos < n:
+    m = TOKEN.match(s, pos)
+    if m is None:
+      if s[pos:].isspace():
+        break
+      raise Unsupported()
+    kind = m.lastgroup
+    pos = m.end()
+    if kind == 'num' and pos < n and (s[pos].isalnum() or s[pos] in '_.'):
+      raise Unsupported()   # like 2x, 1j or 1_000
+    res.append((kind, m.group(kind)))
+  res.append(('end', ''))
+  return res
+
+
+class _Node:
+  """Result of binary operation before the evaluation,
+  nested Add and Mul are merged as in parse_expr"""
+
+  def __init__(self, op, args):
+    self.op = op
+    self.args = args
+
+
+class Parser:
+  """Recursive descent parser, raise Unsupported when the input
+  is out of the known grammar"""
+
+  def __init__(self, xor, evaluate):
+    self.xor = xor
+    self.evaluate = evaluate
+
+  def parse(self, s):
+    """Get sympy expression"""
+    self._toks = _tokens(s)
+    self._pos = 0
+    node = self._sum()
+    if self._toks[self._pos][0] != 'end':
+      raise Unsupported()
+    return self._build(node)
+
+  # ====== tokens ========
+
+  def _peek(self):
+    return self._toks[self._pos]
+
+  def _next(self):
+    tok = self._toks[self._pos]
+    self._pos += 1
+    return tok
+
+  def _expect(self, op):
+    if self._next() != ('op', op):
+      raise Unsupported()
+
+  # ====== grammar =======
+
+  def _sum(self):
+    """term (('+'|'-') term)*"""
+    left = self._term()
+    while self._peek() in (('op', '+'), ('op', '-')):
+      op = self._next()[1]
+      right = self._term()
+      if op == '+':
+        left = self._binary('Add', left, right)
+      elif self.evaluate:
+        left = self._build(left) - self._build(right)
+      else:
+        left = self._binary('Add', left, _Node('Mul', [sympy.Integer(-1), right]))
+    return left
+
+  def _term(self):
+    """unary (('*'|'/') unary)*"""
+    left = self._unary()
+    while self._peek() in (('op', '*'), ('op', '/')):
+      op = self._next()[1]
+      right = self._unary()
+      if op == '/':
+        if self.evaluate:
+          left = self._build(left) / self._build(right)
+          continue
+        right = _Node('Pow', [right, sympy.Integer(-1)])
+      left = self._binary('Mul', left, right)
+    return left
+
+  def _unary(self):
+    """('+'|'-') unary | power"""
+    tok = self._peek()
+    if tok == ('op', '-'):
+      self._next()
+      return -self._build(self._unary())
+    if tok == ('op', '+'):
+      self._next()
+      return +self._build(self._unary())
+    return self._power()
+
+  def _power(self):
+    """atom ('**' unary)?"""
+    base = self._atom()
+    tok = self._peek()
+    if tok == ('op', '**') or tok == ('op', '^') and self.xor:
+      self._next()
+      exp = self._unary()
+      if self.evaluate:
+        return self._build(base) ** self._build(exp)
+      return _Node('Pow', [base, exp])
+    if tok == ('op', '^'):
+      raise Unsupported()   # logical xor
+    return base
+
+  def _atom(self):
+    """number | name | function '(' args ')' | '(' sum ')'"""
+    kind, val = self._next()
+    if kind == 'num':
+      if '.' in val or 'e' in val or 'E' in val:
+        return sympy.Float(val)
+      if len(val) > 1 and val[0] == '0':
+        raise Unsupported()   # syntax error in Python
+      return sympy.Integer(val)
+    if kind == 'name':
+      called = self._peek() == ('op', '(')
+      if called and val in FUNCTIONS:
+        return self._call(getattr(sympy, val))
+      if not called and val in CONSTANTS:
+        return getattr(sympy, val)
+      if called or val in _reservedNames():
+        raise Unsupported()
+      return sympy.Symbol(val)
+    if (kind, val) == ('op', '('):
+      node = self._sum()
+      self._expect(')')
+      return node
+    raise Unsupported()
+
+  def _call(self, fn):
+    """Arguments of the function"""
+    self._expect('(')
+    args = [self._build(self._sum())]
+    while self._peek() == ('op', ','):
+      self._next()
+      args.append(self._build(self._sum()))
+    self._expect(')')
+    return fn(*args) if self.evaluate else fn(*args, evaluate=False)
+
+  # ====== objects =======
+
+  def _binary(self, op, left, right):
+    """Node for Add or Mul, evaluated immediately in the evaluate mode"""
+    if self.evaluate:
+      left, right = self._build(left), self._build(right)
+      return left + right if op == 'Add' else left * right
+    args = []
+    for v in (left, right):
+      if isinstance(v, _Node) and v.op == op:
+        args.extend(v.args)
+      else:
+        args.append(v)
+    return _Node(op, args)
+
+  def _build(self, node):
+    """Convert node to the sympy object"""
+    if not isinstance(node, _Node):
+      return node
+    cls = getattr(sympy, node.op)
+    return cls(*[self._build(v) for v in node.args], evaluate=False)
+
+
+_parsers = {}
+
+def parse(s, xor, evaluate):
+  """Get sympy expression or raise Unsupported"""
+  key = (xor, evaluate)
+  p = _parsers.get(key)
+  if p is None:
+    p = _parsers[key] = Parser(xor, evaluate)
+  return p.parse(s)
@@ -0,0 +1,161 @@
+# Reading and writing of the text files without blocking the editor
+
+import os
+import stat
+import mmap
+import codecs
+import hashlib
+import locale
+import tempfile
+
+READ_CHUNK = 1 << 20     # bytes inserted in one idle callback
+MMAP_SIZE = 16 << 20     # read bigger files with mmap
+WRITE_LINES = 10000      # lines obtained from the widget at once
+
+def encoding():
+  """Default encoding of the text files"""
+  return locale.getpreferredencoding(False)
+
+
+class FileLoader:
+  """Insert file content into the text widget by chunks in idle time.
+  The file which is not a text in the default encoding is not loaded,
+  failed(message) is called instead: the replaced bytes would be lost on saving."""
+
+  def __init__(self, text, name, progress=None, done=None, failed=None):
+    self.text = text
+    self.name = name
+    self.progress = progress
+    self.done = done
+    self.failed = failed
+    self.size = os.path.getsize(name)
+    self._file = open(name, 'rb')
+    self._map = None
+    if self.size > MMAP_SIZE:
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    self._pos = 0
+    self._tail = ''
+    self._decoder = codecs.getincrementaldecoder(encoding())()
+    self._md5 = hashlib.md5()
+    self._after = None
+
+  def start(self):
+    """Begin reading, the text widget is locked until the end"""
+    self.text.configure(undo=False, state='disabled')
+    self._after = self.text.after_idle(self._step)
+
+  def cancel(self):
+    """Stop reading"""
+    if self._after is not None:
+      self.text.after_cancel(self._after)
+      self._after = None
+    self._close()
+
+  def _read(self):
+    """Get next chunk of bytes"""
+    if self._map is not None:
+      data = self._map[self._pos:self._pos+READ_CHUNK]
+    else:
+      data = self._file.read(READ_CHUNK)
+    self._pos += len(data)
+    return data
+
+  def _step(self):
+    """Insert next chunk"""
+    self._after = None
+    data = self._read()
+    final = not data
+    self._md5.update(data)
+    pending = len(self._decoder.getstate()[0])
+    try:
+      s = self._tail + self._decoder.decode(data, final=final)
+    except UnicodeDecodeError as err:
+      self._close()
+      if self.failed is not None:
+        pos = self._pos - len(data) - pending + err.start
+        self.failed("not %s text, wrong byte at offset %d" % (encoding(), pos))
+      return
+    # '\r\n' can be split between chunks
+    self._tail = ''
+    if not final and s.endswith('\r'):
+      s, self._tail = s[:-1], '\r'
+    s = s.replace('\r\n', '\n').replace('\r', '\n')
+    self.text.configure(state='normal')
+    self.text.insert('end - 1c', s)
+    self.text.configure(state='disabled')
+    if self.progress is not None:
+      self.progress(self._pos, self.size)
+    if final:
+      self._close()
+      if self.done is not None:
+        self.done(self._md5.hexdigest())
+    else:
+      self._after = self.text.after_idle(self._step)
+
+  def _close(self):
+    """Release file and unlock the widget"""
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+    self._file.close()
+    self.text.configure(undo=True, state='normal')
+    self.text.edit_reset()
+
+
+def _textChunks(text):
+  """Get content of the text widget as encoded blocks of lines"""
+  enc = encoding()
+  n = text.lineCount()
+  for beg in range(1, n + 1, WRITE_LINES):
+    end = beg + WRITE_LINES
+    s = text.get('%d.0' % beg, '%d.0' % end if end <= n else 'end - 1c')
+    if os.linesep != '\n':
+      s = s.replace('\n', os.linesep)
+    yield s.encode(enc)
+
+def saveText(text, name):
+  """Write text to a temporary file and replace the target with it,
+  return md5 of the saved content"""
+  return saveChunks(name, _textChunks(text))
+
+def saveChunks(name, chunks):
+  """Write sequence of bytes to a temporary file and replace the target with it,
+  return md5 of the saved content"""
+  name = os.path.abspath(name)
+  dirname = os.path.dirname(name)
+  fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.%s.' % os.path.basename(name), suffix='.tmp')
+  md5 = hashlib.md5()
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      for data in chunks:
+        md5.update(data)
+        f.write(data)
+      f.flush()
+      os.fsync(f.fileno())
+    if os.path.exists(name):
+      mode = stat.S_IMODE(os.stat(name).st_mode)
+    else:
+      mask = os.umask(0)
+      os.umask(mask)
+      mode = 0o666 & ~mask
+    os.chmod(tmp, mode)
+    os.replace(tmp, name)
+  except BaseException:
+    if os.path.exists(tmp):
+      os.unlink(tmp)
+    raise
+  _syncDir(dirname)
+  return md5.hexdigest()
+
+def _syncDir(dirname):
+  """Make the rename durable, not supported on all systems"""
+  try:
+    fd = os.open(dirname, os.O_RDONLY)
+  except OSError:
+    return
+  try:
+    os.fsync(fd)
+  except OSError:
+    pass
+  finally:
+    os.close(fd)
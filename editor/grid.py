@@ -0,0 +1,159 @@
+# Numerical evaluation of expression over grid of values
+
+import io
+import importlib
+
+from .symbolic import LruCache, sympy, _splitTop
+from . import perf
+
+GRID_CHUNK = 1 << 16     # points per vectorized call
+GRID_TABLE = 50          # maximal number of points to show as table
+GRID_POINTS = 1 << 30    # maximal grid size
+COMPILED_SIZE = 128      # number of compiled expressions
+COMPILED_MEM = 16 << 20  # their approximate memory, bytes
+
+_compiled = LruCache(COMPILED_SIZE, COMPILED_MEM)
+
+def _numpy():
+  """Import numpy or raise ValueError"""
+  try:
+    return importlib.import_module('numpy')
+  except ImportError:
+    raise ValueError("Grid evaluation requires numpy")
+
+def _number(s):
+  """Evaluate constant like '2*pi'"""
+  v = sympy.sympify(s.strip().replace('^', '**'))
+  try:
+    return float(v)
+  except TypeError:
+    raise ValueError("Not a number: %s" % s.strip())
+
+def parseRanges(spec):
+  """Convert string like 'x=0:1:11, y=[1,2,5], z=3' to the list
+  of (name, values), range 'a:b:n' has n points from a to b"""
+  np = _numpy()
+  res = []
+  for item in _splitTop(spec, ','):
+    if not item.strip():
+      continue
+    name, eq, val = item.partition('=')
+    name, val = name.strip(), val.strip()
+    if not (eq and name.isidentifier() and val):
+      raise ValueError("Expected 'name=values', got '%s'" % item.strip())
+    if val.startswith('[') and val.endswith(']'):
+      values = np.array([_number(v) for v in _splitTop(val[1:-1], ',') if v.strip()])
+    elif ':' in val:
+      par = val.split(':')
+      if len(par) != 3:
+        raise ValueError("Expected 'begin:end:points', got '%s'" % val)
+      n = int(par[2])
+      if n < 1:
+        raise ValueError("Wrong number of points for %s" % name)
+      values = np.linspace(_number(par[0]), _number(par[1]), n)
+    else:
+      values = np.array([_number(val)])
+    if values.size == 0:
+      raise ValueError("No values for %s" % name)
+    res.append((name, values))
+  if not res:
+    raise ValueError("Ranges are not defined")
+  return res
+
+def compiled(expr, names):
+  """Vectorized function of the expression, cached"""
+  key = (expr, names)
+  fn = _compiled.get(key)
+  if fn is None:
+    with perf.span('sym.lambdify'):
+      fn = sympy.lambdify([sympy.Symbol(v) for v in names], expr, 'numpy')
+    _compiled.put(key, fn, 100 * len(str(expr)))
+  return fn
+
+class _Stat:
+  """Accumulate statistics chunk by chunk"""
+
+  def __init__(self):
+    self.n = self.bad = 0
+    self.total = self.total2 = 0.0
+    self.lo = self.hi = None     # (value, flat index)
+
+  def add(self, np, val, first):
+    ok = np.isfinite(val)
+    self.bad += val.size - int(ok.sum())
+    if not ok.any():
+      return
+    good = val[ok]
+    self.n += good.size
+    self.total += float(good.sum())
+    self.total2 += float((good * good).sum())
+    pos = np.flatnonzero(ok)
+    i, j = pos[good.argmin()], pos[good.argmax()]
+    if self.lo is None or val[i] < self.lo[0]:
+      self.lo = (float(val[i]), first + int(i))
+    if self.hi is None or val[j] > self.hi[0]:
+      self.hi = (float(val[j]), first + int(j))
+
+def _point(np, ranges, shape, flat):
+  """Variable values for the flat index as string"""
+  idx = np.unravel_index(flat, shape)
+  return ', '.join('%s=%g' % (v, x[i]) for (v, x), i in zip(ranges, idx))
+
+def evaluate(expr, spec, path=''):
+  """Evaluate expression on the grid, get table or summary as text,
+  optionally save all the points to the CSV file"""
+  np = _numpy()
+  ranges = parseRanges(spec)
+  names = tuple(v for v, _ in ranges)
+  free = {str(v) for v in expr.free_symbols}
+  missing = sorted(free - set(names))
+  if missing:
+    raise ValueError("No values for %s" % ', '.join(missing))
+  fn = compiled(expr, names)
+  shape = tuple(x.size for _, x in ranges)
+  total = 1
+  for n in shape:
+    total *= n
+  if total > GRID_POINTS:
+    raise ValueError("Too many points: %d" % total)
+  table = [] if total <= GRID_TABLE else None
+  stat = _Stat()
+  dst = open(path, 'w', newline='') if path else None
+  try:
+    if dst:
+      dst.write(','.join(names + ('value',)) + '\n')
+    with perf.span('sym.grid'):
+      for first in range(0, total, GRID_CHUNK):
+        idx = np.unravel_index(np.arange(first, min(first + GRID_CHUNK, total)), shape)
+        args = [x[i] for (_, x), i in zip(ranges, idx)]
+        with np.errstate(all='ignore'):
+          val = np.broadcast_to(np.asarray(fn(*args)), args[0].shape)
+          if np.iscomplexobj(val):
+            # complex points are undefined for the statistics
+            val = np.where(val.imag == 0, val.real, np.nan)
+          val = val.astype(float)
+        stat.add(np, val, first)
+        if dst:
+          buf = io.StringIO()
+          np.savetxt(buf, np.column_stack(args + [val]), fmt='%.17g', delimiter=',')
+          dst.write(buf.getvalue())
+        if table is not None:
+          table.extend(zip(zip(*args), val))
+  finally:
+    if dst:
+      dst.close()
+  if table is not None:
+    lines = ['  '.join('%12s' % v for v in names + ('value',))]
+    for xs, v in table:
+      lines.append('  '.join('%12g' % x for x in xs + (v,)))
+    return '\n'.join(lines)
+  lines = ['points: %d' % total]
+  if stat.n:
+    mean = stat.total / stat.n
+    std = max(stat.total2 / stat.n - mean * mean, 0.0) ** 0.5
+    lines.append('min: %g at %s' % (stat.lo[0], _point(np, ranges, shape, stat.lo[1])))
+    lines.append('max: %g at %s' % (stat.hi[0], _point(np, ranges, shape, stat.hi[1])))
+    lines.append('mean: %g, std: %g' % (mean, std))
+  if stat.bad:
+    lines.append('undefined: %d' % stat.bad)
+  return '\n'.join(lines)
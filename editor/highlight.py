@@ -0,0 +1,223 @@
+# Incremental highlighting of the text
+
+import re
+
+from . import perf
+
+# integer, decimal or exponential number, not a part of a name
+NUMBER = re.compile(r'(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+BRACKET = re.compile(r'[()\[\]{}]')
+BRACKET_PAIRS = {'(': ')', '[': ']', '{': '}'}
+CHUNK_LINES = 500   # lines processed in one idle callback
+BRACKET_DELAY = 300 # ms, update of the unbalanced brackets after editing
+
+_OPENING = {v: k for k, v in BRACKET_PAIRS.items()}
+
+def _matchBrackets(items):
+  """Get pairs and unbalanced positions from the sequence of (position, bracket),
+  each bracket type is checked separately"""
+  stacks = {k: [] for k in BRACKET_PAIRS}
+  pairs, bad = {}, []
+  for pos, c in items:
+    if c in stacks:
+      stacks[c].append(pos)
+    else:
+      st = stacks[_OPENING[c]]
+      if st:
+        p = st.pop()
+        pairs[p] = pos
+        pairs[pos] = p
+      else:
+        bad.append(pos)
+  for st in stacks.values():
+    bad.extend(st)
+  bad.sort()
+  return pairs, bad
+
+
+class LineSet:
+  """Set of line numbers stored as sorted list of [begin, end) ranges"""
+
+  def __init__(self):
+    self.ranges = []
+
+  def __bool__(self):
+    return bool(self.ranges)
+
+  def add(self, beg, end):
+    """Include lines from beg to end-1"""
+    res = []
+    for b, e in self.ranges:
+      if e < beg or b > end:
+        res.append((b, e))
+      else:
+        beg, end = min(b, beg), max(e, end)
+    res.append((beg, end))
+    res.sort()
+    self.ranges = res
+
+  def remove(self, beg, end):
+    """Exclude lines from beg to end-1"""
+    res = []
+    for b, e in self.ranges:
+      if b < beg:
+        res.append((b, min(e, beg)))
+      if e > end:
+        res.append((max(b, end), e))
+    self.ranges = res
+
+  def replace(self, line, nold, nnew):
+    """Update numbers when lines [line, line+nold) are replaced
+    by [line, line+nnew), the new lines are included"""
+    self.remove(line, line + nold)
+    shift, end = nnew - nold, line + nold
+    self.ranges = [(b + shift, e + shift) if b >= end else (b, e) for b, e in self.ranges]
+    self.add(line, line + nnew)
+
+  def pop(self, beg=None, end=None, n=CHUNK_LINES):
+    """Take up to n lines, the first ones or from the given region"""
+    for b, e in self.ranges:
+      if beg is not None:
+        b, e = max(b, beg), min(e, end)
+      if b < e:
+        e = min(e, b + n)
+        self.remove(b, e)
+        return b, e
+    return None
+
+
+class NumberHighlighter:
+  """Highlight numbers in the changed lines, the visible ones first,
+  the rest of the text is processed in idle time"""
+
+  def __init__(self, text, tag):
+    self.text = text
+    self.tag = tag
+    self.dirty = LineSet()
+    self._after = None
+    text.addListener(self._onChange)
+
+  def _onChange(self, line, nold, nnew):
+    """Mark the modified lines"""
+    self.dirty.replace(line, nold, nnew)
+    if self._after is None:
+      self._after = self.text.after_idle(self._update)
+
+  def viewport(self):
+    """Range of visible lines"""
+    beg = int(self.text.index('@0,0').split('.')[0])
+    end = int(self.text.index('@0,%d' % self.text.winfo_height()).split('.')[0])
+    return beg, end + 1
+
+  def _update(self):
+    """Process visible lines and the next chunk"""
+    self._after = None
+    last = self.text.lineCount()
+    self.dirty.remove(last + 1, float('inf'))
+    beg, end = self.viewport()
+    while True:
+      rng = self.dirty.pop(beg, end)
+      if rng is None: break
+      self.checkLines(*rng)
+    rng = self.dirty.pop()
+    if rng is not None:
+      self.checkLines(*rng)
+    if self.dirty:
+      self._after = self.text.after_idle(self._update)
+
+  def checkLines(self, beg, end):
+    """Highlight numbers in the lines [beg, end)"""
+    with perf.span('highlight.numbers'):
+      i_beg, i_end = '%d.0' % beg, '%d.end' % (end - 1)
+      self.text.tag_remove(self.tag, i_beg, i_end)
+      indices = []
+      for n, s in enumerate(self.text.get(i_beg, i_end).split('\n'), beg):
+        for m in NUMBER.finditer(s):
+          indices.append('%d.%d' % (n, m.start()))
+          indices.append('%d.%d' % (n, m.end()))
+      self.text.tagAddAll(self.tag, indices)
+
+
+class BracketIndex:
+  """Positions of brackets cached for each line, pairs are found
+  with a single pass over the cache"""
+
+  def __init__(self, text, tag):
+    self.text = text
+    self.tag = tag
+    self._lines = [None] * text.lineCount()
+    self._pairs = None
+    self._bad = []
+    self._after = None
+    text.addListener(self._onChange)
+
+  def _onChange(self, line, nold, nnew):
+    """Forget brackets in the modified lines"""
+    self._lines[line-1:line-1+nold] = [None] * nnew
+    self._pairs = None
+    if self._after is not None:
+      self.text.after_cancel(self._after)
+    self._after = self.text.after(BRACKET_DELAY, self._showUnbalanced)
+
+  def _scan(self):
+    """Find brackets in the lines which are not cached"""
+    n = self.text.lineCount()
+    if len(self._lines) != n:
+      self._lines = [None] * n
+    i = 0
+    while i < n:
+      if self._lines[i] is not None:
+        i += 1
+        continue
+      j = i
+      while j < n and j - i < CHUNK_LINES and self._lines[j] is None:
+        j += 1
+      txt = self.text.get('%d.0' % (i+1), '%d.end' % j)
+      for k, s in enumerate(txt.split('\n'), i):
+        self._lines[k] = tuple((m.start(), m.group()) for m in BRACKET.finditer(s))
+      i = j
+
+  def _items(self, beg=(1, 0), end=None):
+    """Iterate over ((line, col), bracket) in the given region"""
+    last = len(self._lines) if end is None else min(end[0], len(self._lines))
+    for n in range(beg[0], last + 1):
+      for col, c in self._lines[n-1]:
+        pos = (n, col)
+        if pos < beg: continue
+        if end is not None and pos >= end: return
+        yield pos, c
+
+  def _update(self):
+    """Rebuild the table of pairs"""
+    if self._pairs is None:
+      with perf.span('highlight.brackets'):
+        self._scan()
+        self._pairs, self._bad = _matchBrackets(self._items())
+
+  def pair(self, line, col):
+    """Position of the pair for the bracket or None"""
+    self._update()
+    return self._pairs.get((line, col))
+
+  def unbalanced(self):
+    """List of positions of the unbalanced brackets"""
+    self._update()
+    return self._bad
+
+  def check(self, beg, end):
+    """Find the first unbalanced bracket in the region, return its index or None"""
+    self._scan()
+    beg, end = [tuple(map(int, self.text.index(i).split('.'))) for i in (beg, end)]
+    _, bad = _matchBrackets(self._items(beg, end))
+    return '%d.%d' % bad[0] if bad else None
+
+  def _showUnbalanced(self):
+    """Highlight the unbalanced brackets of the whole text"""
+    self._after = None
+    self.text.tag_remove(self.tag, '1.0', 'end')
+    indices = []
+    for line, col in self.unbalanced():
+      indices.append('%d.%d' % (line, col))
+      indices.append('%d.%d' % (line, col + 1))
+    if indices:
+      self.text.tagAddAll(self.tag, indices)
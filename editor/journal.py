@@ -0,0 +1,195 @@
+# Autosave journal: the edit operations are appended to a binary file
+# next to the document and replayed after a crash
+
+import os
+import struct
+import zlib
+
+from . import perf
+
+WRITE_DELAY = 300          # collect operations before writing, ms
+SYNC_DELAY = 2000          # fsync after the write, ms
+COMPACT_SIZE = 4 << 20     # compact journal bigger than this, bytes
+
+MAGIC = b'TMJ1'
+HEADER = struct.Struct('<4s16s')        # magic, md5 of the saved file
+RECORD = struct.Struct('<BIIIIII')      # kind, line1, col1, line2, col2, size, crc
+INSERT, DELETE, SNAPSHOT = 1, 2, 3
+
+def journalPath(name):
+  """Hidden file in the folder of the document"""
+  folder, base = os.path.split(os.path.abspath(name))
+  return os.path.join(folder, '.%s.termit-journal' % base)
+
+def _index(s):
+  line, col = str(s).split('.')
+  return int(line), int(col)
+
+def _record(kind, beg=(0, 0), end=(0, 0), txt=''):
+  """Encode operation with checksum"""
+  data = txt.encode('utf-8')
+  head = RECORD.pack(kind, *beg, *end, len(data), 0)[:-4]
+  return head + struct.pack('<I', zlib.crc32(data, zlib.crc32(head))) + data
+
+def readJournal(path):
+  """Get md5 of the base file and list of operations ('insert', index, text),
+  ('delete', beg, end) or ('snapshot', text). The records after a damaged one
+  are ignored, None is returned when there is no valid journal."""
+  try:
+    with open(path, 'rb') as f:
+      data = f.read()
+  except OSError:
+    return None
+  if len(data) < HEADER.size:
+    return None
+  magic, digest = HEADER.unpack_from(data)
+  if magic != MAGIC:
+    return None
+  ops, pos = [], HEADER.size
+  while pos + RECORD.size <= len(data):
+    kind, l1, c1, l2, c2, size, crc = RECORD.unpack_from(data, pos)
+    end = pos + RECORD.size + size
+    payload = data[pos+RECORD.size:end]
+    if len(payload) != size or \
+        zlib.crc32(payload, zlib.crc32(data[pos:pos+RECORD.size-4])) != crc:
+      break    # unfinished write
+    txt = payload.decode('utf-8')
+    if kind == INSERT:
+      ops.append(('insert', '%d.%d' % (l1, c1), txt))
+    elif kind == DELETE:
+      ops.append(('delete', '%d.%d' % (l1, c1), '%d.%d' % (l2, c2)))
+    elif kind == SNAPSHOT:
+      ops.append(('snapshot', txt))
+    else:
+      break
+    pos = end
+  return digest.hex(), ops
+
+def replay(text, ops):
+  """Apply operations to the text widget, only the last snapshot is used"""
+  first = 0
+  for i, op in enumerate(ops):
+    if op[0] == 'snapshot':
+      first = i
+  with perf.span('journal.replay'):
+    for op in ops[first:]:
+      if op[0] == 'insert':
+        text.insert(op[1], op[2])
+      elif op[0] == 'delete':
+        text.delete(op[1], op[2])
+      else:
+        text.delete('1.0', 'end')
+        text.insert('1.0', op[1])
+
+
+class Journal:
+  """Append operations of the text widget to the file. Records are written
+  in batches and synced on timer, too long journal is replaced with the
+  snapshot of the whole text. Undo and redo come as the usual operations,
+  the snapshot is also written for the rare changes with unknown positions."""
+
+  def __init__(self, text, path):
+    self.text = text
+    self.path = path
+    self._file = None
+    self._digest = None
+    self._buf = bytearray()
+    self._reset = False       # snapshot is required
+    self._base = 0            # size after the last compaction
+    self._afterWrite = None
+    self._afterSync = None
+
+  def start(self, digest):
+    """Begin new journal for the saved file with the given md5"""
+    self._digest = bytes.fromhex(digest)
+    self._close()
+    self._file = open(self.path, 'wb')
+    self._file.write(HEADER.pack(MAGIC, self._digest))
+    self._file.flush()
+    self._base = self._file.tell()
+
+  def resume(self, digest):
+    """Continue the existing journal"""
+    self._digest = bytes.fromhex(digest)
+    self._close()
+    self._file = open(self.path, 'ab')
+    self._base = self._file.tell()
+
+  def record(self, cmd, *args):
+    """Save operation reported by TextView"""
+    if self._file is None:
+      return
+    if cmd == 'insert':
+      self._buf += _record(INSERT, _index(args[0]), txt=args[1])
+    elif cmd == 'delete':
+      self._buf += _record(DELETE, _index(args[0]), _index(args[1]))
+    else:
+      # positions are unknown, the pending records are not needed
+      self._buf.clear()
+      self._reset = True
+    if self._afterWrite is None:
+      self._afterWrite = self.text.after(WRITE_DELAY, self._write)
+
+  def close(self, remove=False):
+    """Write pending records, delete the file if the changes are not needed"""
+    for after in (self._afterWrite, self._afterSync):
+      if after is not None:
+        self.text.after_cancel(after)
+    self._afterWrite = self._afterSync = None
+    if not remove:
+      self._write()
+    self._close()
+    if remove:
+      try:
+        os.remove(self.path)
+      except OSError:
+        pass
+
+  # ====== internal ========
+
+  def _close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def _write(self):
+    """Append the collected records"""
+    self._afterWrite = None
+    if self._file is None:
+      return
+    try:
+      with perf.span('journal.write'):
+        if self._reset or self._file.tell() > max(COMPACT_SIZE, 2 * self._base):
+          self._compact()
+        elif self._buf:
+          self._file.write(self._buf)
+          self._file.flush()
+    except OSError:
+      return   # the document is not affected, try with the next batch
+    self._buf.clear()
+    if self._afterSync is None:
+      self._afterSync = self.text.after(SYNC_DELAY, self._sync)
+
+  def _sync(self):
+    """Move the written data to disk"""
+    self._afterSync = None
+    if self._file is not None:
+      with perf.span('journal.sync'):
+        try:
+          os.fsync(self._file.fileno())
+        except OSError:
+          pass
+
+  def _compact(self):
+    """Replace journal with the snapshot of the current text"""
+    tmp = self.path + '.tmp'
+    with open(tmp, 'wb') as f:
+      f.write(HEADER.pack(MAGIC, self._digest))
+      f.write(_record(SNAPSHOT, txt=self.text.content()))
+      f.flush()
+      os.fsync(f.fileno())
+    self._close()
+    os.replace(tmp, self.path)
+    self._file = open(self.path, 'ab')
+    self._base = self._file.tell()
+    self._reset = False
@@ -0,0 +1,64 @@
+# Named sequences of the symbolical operations
+
+import os
+import json
+
+from .symbolic import parseOps, formatOps
+
+def configDir():
+  """Folder for the user settings"""
+  base = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+  return os.path.join(base, 'termit')
+
+
+class Macros:
+  """Storage of macros, each one is a string like 'expand,collect:x'"""
+
+  def __init__(self, path=None):
+    self.path = path or os.path.join(configDir(), 'macros.json')
+    self._specs = {}
+    self._ops = {}     # parsed macros
+    try:
+      with open(self.path) as f:
+        self._specs = json.load(f)
+    except (OSError, ValueError):
+      pass
+
+  def names(self):
+    """Sorted list of macro names"""
+    return sorted(self._specs)
+
+  def spec(self, name):
+    """Get macro as string"""
+    return self._specs[name]
+
+  def get(self, name):
+    """Get macro as list of (method, args)"""
+    ops = self._ops.get(name)
+    if ops is None:
+      ops = self._ops[name] = tuple(parseOps(self._specs[name]))
+    return ops
+
+  def define(self, name, spec):
+    """Add or replace macro, raise ValueError for wrong specification"""
+    ops = tuple(parseOps(spec))
+    if not ops:
+      raise ValueError("Empty macro")
+    self._specs[name] = formatOps(ops)
+    self._ops[name] = ops
+    self._save()
+
+  def remove(self, name):
+    """Delete macro"""
+    self._specs.pop(name, None)
+    self._ops.pop(name, None)
+    self._save()
+
+  def _save(self):
+    """Write macros to the file"""
+    try:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      with open(self.path, 'w') as f:
+        json.dump(self._specs, f, indent=1)
+    except OSError:
+      pass    # available in the current session only
@@ -0,0 +1,85 @@
+# Lightweight timing of the hot paths
+
+import os
+import time
+import json
+import itertools
+import contextlib
+import collections
+
+RING_SIZE = 5000                 # number of stored spans
+PROFILE_ENV = 'TERMIT_PROFILE'   # directory for the cProfile dumps
+
+# (name, start, duration, pid), time in seconds
+_spans = collections.deque(maxlen=RING_SIZE)
+_dumps = itertools.count(1)
+
+@contextlib.contextmanager
+def span(name):
+  """Measure execution time of the block"""
+  t = time.perf_counter()
+  try:
+    yield
+  finally:
+    _spans.append((name, t, time.perf_counter() - t, os.getpid()))
+
+def add(name, start, duration):
+  """Save measured interval"""
+  _spans.append((name, start, duration, os.getpid()))
+
+def record(items):
+  """Add spans obtained from other process"""
+  _spans.extend(tuple(v) for v in items)
+
+def drain():
+  """Get and remove all spans"""
+  res = list(_spans)
+  _spans.clear()
+  return res
+
+def recent(n=50):
+  """Last n spans"""
+  return list(_spans)[-n:]
+
+def summary():
+  """Dictionary name: (count, total, mean, max)"""
+  acc = {}
+  for name, _, dt, _ in _spans:
+    n, total, top = acc.get(name, (0, 0.0, 0.0))
+    acc[name] = (n + 1, total + dt, max(top, dt))
+  return {k: (n, total, total / n, top) for k, (n, total, top) in acc.items()}
+
+def exportJson(path):
+  """Save spans and summary"""
+  data = {
+    'spans': [{'name': n, 'start': t, 'duration': dt, 'pid': pid}
+              for n, t, dt, pid in _spans],
+    'summary': {k: dict(zip(('count', 'total', 'mean', 'max'), v))
+                for k, v in summary().items()},
+  }
+  with open(path, 'w') as f:
+    json.dump(data, f, indent=1)
+
+def exportTrace(path):
+  """Save spans in the Chrome trace format (chrome://tracing)"""
+  events = [{'name': n, 'ph': 'X', 'ts': t * 1e6, 'dur': dt * 1e6, 'pid': pid, 'tid': 0}
+            for n, t, dt, pid in _spans]
+  with open(path, 'w') as f:
+    json.dump({'traceEvents': events}, f)
+
+@contextlib.contextmanager
+def profile(name):
+  """Dump cProfile statistics for the block if TERMIT_PROFILE is set"""
+  folder = os.environ.get(PROFILE_ENV)
+  if not folder:
+    yield
+    return
+  import cProfile
+  prof = cProfile.Profile()
+  prof.enable()
+  try:
+    yield
+  finally:
+    prof.disable()
+    os.makedirs(folder, exist_ok=True)
+    prof.dump_stats(os.path.join(folder, '%s-%d-%d.prof' % (name, os.getpid(), next(_dumps))))
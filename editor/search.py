@@ -0,0 +1,45 @@
+# Search and replace over the whole text in a single pass
+
+import re
+
+def makePattern(find, nocase=False, regex=False, word=False):
+  """Compile pattern for the search options, raise re.error for wrong regex"""
+  src = find if regex else re.escape(find)
+  if word:
+    src = r'\b(?:%s)\b' % src
+  flags = re.MULTILINE
+  if nocase:
+    flags |= re.IGNORECASE
+  return re.compile(src, flags)
+
+def countMatches(txt, pattern):
+  """Number of matches in the text"""
+  return sum(1 for _ in pattern.finditer(txt))
+
+def _expand(m, repl, regex):
+  """Replacement for the match"""
+  return m.expand(repl) if regex else repl
+
+def replaceAll(txt, pattern, repl, regex=False):
+  """Replace all matches, return (begin, end, new_substring, count),
+  where [begin, end) is the modified region of the text,
+  or None if nothing is found"""
+  parts, beg, last, n = [], None, 0, 0
+  for m in pattern.finditer(txt):
+    if beg is None:
+      beg = last = m.start()
+    parts.append(txt[last:m.start()])
+    parts.append(_expand(m, repl, regex))
+    last = m.end()
+    n += 1
+  if beg is None:
+    return None
+  return beg, last, ''.join(parts), n
+
+def replaceNext(txt, pattern, repl, pos, regex=False):
+  """Replace the first match after the position, continue from the
+  beginning of the text if need, return (begin, end, new_substring, 1) or None"""
+  m = pattern.search(txt, pos) or pattern.search(txt, 0, pos)
+  if m is None:
+    return None
+  return m.start(), m.end(), _expand(m, repl, regex), 1
@@ -0,0 +1,117 @@
+# Persistent cache of the symbolical results,
+# shared between sessions and worker processes
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+STORE_SIZE = 64 << 20     # maximal total size of the stored results, bytes
+STORE_TIMEOUT = 5         # wait for the lock of other process, s
+EVICT_EVERY = 100         # check size after this number of writes
+EVICT_LEVEL = 0.8         # part of the size kept after eviction
+
+def cacheDir():
+  """Folder for the cached data"""
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(base, 'termit')
+
+def makeKey(s, name, args, settings, version):
+  """Hash of the normalized input, operation and settings"""
+  data = json.dumps([' '.join(s.split()), name, args, sorted(settings.items()), version])
+  return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResultStore:
+  """SQLite table of results, the least recently used are removed
+  when the total size exceeds the limit. Errors are ignored,
+  in this case the results are just computed again."""
+
+  def __init__(self, path=None, maxsize=STORE_SIZE):
+    self.path = path or os.path.join(cacheDir(), 'results.sqlite')
+    self.maxsize = maxsize
+    self._db = None
+    self._writes = 0
+
+  def _connect(self):
+    """Open database on the first access"""
+    if self._db is None:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      db = sqlite3.connect(self.path, timeout=STORE_TIMEOUT, isolation_level=None)
+      db.execute('PRAGMA journal_mode=WAL')
+      db.execute('PRAGMA synchronous=NORMAL')
+      db.execute('CREATE TABLE IF NOT EXISTS results '
+                 '(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)')
+      db.execute('CREATE INDEX IF NOT EXISTS results_used ON results(used)')
+      self._db = db
+    return self._db
+
+  def get(self, key):
+    """Find result or return None"""
+    try:
+      db = self._connect()
+      row = db.execute('SELECT value FROM results WHERE key=?', (key,)).fetchone()
+      if row is not None:
+        db.execute('UPDATE results SET used=? WHERE key=?', (time.time(), key))
+        return row[0]
+    except (sqlite3.Error, OSError):
+      pass
+    return None
+
+  def put(self, key, value):
+    """Save result"""
+    try:
+      db = self._connect()
+      db.execute('INSERT OR REPLACE INTO results VALUES (?,?,?,?)',
+                 (key, value, len(value), time.time()))
+      self._writes += 1
+      if self._writes % EVICT_EVERY == 0:
+        self.evict()
+    except (sqlite3.Error, OSError):
+      pass
+
+  def evict(self):
+    """Remove old results if the size limit is exceeded"""
+    db = self._connect()
+    total = db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+    if total <= self.maxsize:
+      return
+    extra = total - int(self.maxsize * EVICT_LEVEL)
+    db.execute('BEGIN IMMEDIATE')
+    try:
+      keys = []
+      for key, size in db.execute('SELECT key, size FROM results ORDER BY used'):
+        keys.append((key,))
+        extra -= size
+        if extra <= 0:
+          break
+      db.executemany('DELETE FROM results WHERE key=?', keys)
+      db.execute('COMMIT')
+    except sqlite3.Error:
+      db.execute('ROLLBACK')
+      raise
+
+  def stats(self):
+    """Dictionary with number of results and their size"""
+    try:
+      n, total = self._connect().execute(
+        'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+    except (sqlite3.Error, OSError):
+      n, total = 0, 0
+    return {'path': self.path, 'count': n, 'size': total, 'maxsize': self.maxsize}
+
+  def clear(self):
+    """Remove all the results"""
+    try:
+      db = self._connect()
+      db.execute('DELETE FROM results')
+      db.execute('VACUUM')
+    except (sqlite3.Error, OSError):
+      pass
+
+  def close(self):
+    """Close connection"""
+    if self._db is not None:
+      self._db.close()
+      self._db = None
@@ -1,90 +1,648 @@
 # Wrapper for the parser and symbolical operations
 # of the sympy module
 
-import sympy
-from sympy.parsing.sympy_parser import parse_expr, \
-  standard_transformations, convert_xor
+import sys
+import importlib
+import collections
+
+from . import perf
+from .store import ResultStore, makeKey
+
+PARSE_SIZE = 256        # number of parsed expressions in cache
+PARSE_MEM = 32 << 20    # approximate memory limit for them, bytes
+RESULT_SIZE = 1024      # number of results in cache
+RESULT_MEM = 32 << 20   # memory limit for results, bytes
+EXPR_CHAR_MEM = 200     # estimated memory of parsed expression per char
+
+class _LazyModule:
+  """Module which is imported on the first access to its attributes,
+  loading of sympy takes a lot of time"""
+
+  def __init__(self, name):
+    self._name = name
+
+  def __getattr__(self, attr):
+    mod = importlib.import_module(self._name)
+    # next time attributes are found without __getattr__
+    self.__dict__.update(mod.__dict__)
+    return getattr(mod, attr)
+
+sympy = _LazyModule('sympy')
+_parser = _LazyModule('sympy.parsing.sympy_parser')
+
+# Sym methods available by name, with the number of additional arguments
+OPERATIONS = {
+  'expand': 0, 'factor': 0, 'simplify': 0, 'collect': 1, 'subs': 2, 'evalf': 0,
+  'trigExpand': 0, 'trigSimp': 0,
+  'powExpandExp': 0, 'powExpandBase': 0, 'powSimp': 0, 'powDenest': 0,
+  'cancel': 0, 'apart': 0,
+  'logExpand': 0, 'logCombine': 0,
+}
+
+def _splitTop(s, sep):
+  """Split string by separator outside of brackets"""
+  res, depth, beg = [], 0, 0
+  for i, c in enumerate(s):
+    if c in '([{':
+      depth += 1
+    elif c in ')]}':
+      depth -= 1
+    elif c == sep and depth == 0:
+      res.append(s[beg:i])
+      beg = i + 1
+  res.append(s[beg:])
+  return res
+
+def parseOps(spec):
+  """Convert string like 'expand,collect:x,subs:x=y' to the list
+  of (method, args) pairs, raise ValueError for wrong input"""
+  names = {k.lower(): k for k in OPERATIONS}
+  ops = []
+  for item in _splitTop(spec, ','):
+    item = item.strip()
+    if not item:
+      continue
+    name, _, par = item.partition(':')
+    key = names.get(name.strip().lower())
+    if key is None:
+      raise ValueError("Unknown operation '%s'" % name.strip())
+    args = tuple(v.strip() for v in _splitTop(par, '=')) if par else ()
+    if len(args) != OPERATIONS[key]:
+      raise ValueError("'%s' expects %d argument(s)" % (key, OPERATIONS[key]))
+    ops.append((key, args))
+  return ops
+
+def formatOps(ops):
+  """Convert list of (method, args) pairs to string for parseOps"""
+  res = []
+  for name, args in ops:
+    res.append('%s:%s' % (name, '='.join(args)) if args else name)
+  return ','.join(res)
+
+class LruCache:
+  """Dictionary with limited size, least recently used items are removed"""
+
+  def __init__(self, maxsize, maxmem):
+    self.maxsize = maxsize
+    self.maxmem = maxmem
+    self.hits = 0
+    self.misses = 0
+    self._data = collections.OrderedDict()
+    self._mem = 0
+
+  def get(self, key):
+    """Find value or return None"""
+    item = self._data.get(key)
+    if item is None:
+      self.misses += 1
+      return None
+    self._data.move_to_end(key)
+    self.hits += 1
+    return item[0]
+
+  def put(self, key, value, size):
+    """Add value with the estimated size (bytes)"""
+    if size > self.maxmem:
+      return
+    old = self._data.pop(key, None)
+    if old is not None:
+      self._mem -= old[1]
+    self._data[key] = (value, size)
+    self._mem += size
+    while len(self._data) > self.maxsize or self._mem > self.maxmem:
+      _, (_, sz) = self._data.popitem(last=False)
+      self._mem -= sz
+
+  def clear(self):
+    """Remove all the items"""
+    self._data.clear()
+    self._mem = 0
+
+  def stats(self):
+    """Usage statistics"""
+    return {'size': len(self._data), 'mem': self._mem,
+            'hits': self.hits, 'misses': self.misses}
+
+
+# named functions are used as a part of the cache key
+
+class _NotPolynomial(Exception):
+  """Expression must be processed by the generic sympy functions"""
+
+def _toRing(expr, gens, R, field):
+  """Convert expression to the ring (or field) element"""
+  if expr.is_Symbol:
+    return gens[expr]
+  if expr.is_Rational:
+    return R(expr)
+  if expr.is_Add:
+    res = R.zero
+    for v in expr.args:
+      res += _toRing(v, gens, R, field)
+    return res
+  if expr.is_Mul:
+    res = R.one
+    for v in expr.args:
+      res *= _toRing(v, gens, R, field)
+    return res
+  if expr.is_Pow and expr.exp.is_Integer and (field or expr.exp >= 0):
+    return _toRing(expr.base, gens, R, field) ** int(expr.exp)
+  raise _NotPolynomial()
+
+def _polyElement(expr, field=False):
+  """Polynomial (or rational function) with rational coefficients
+  as element of the sparse ring, raise _NotPolynomial for other expressions"""
+  if not isinstance(expr, sympy.Expr):
+    raise _NotPolynomial()    # tuples, matrices, relations
+  symbols = sorted(expr.free_symbols, key=sympy.default_sort_key)
+  if not symbols:
+    raise _NotPolynomial()
+  if field or any(not v.is_Integer for v in expr.atoms(sympy.Rational)):
+    domain = sympy.QQ
+  else:
+    domain = sympy.ZZ
+  R, *gens = (sympy.field if field else sympy.ring)(symbols, domain)
+  return _toRing(expr, dict(zip(symbols, gens)), R, field)
+
+def _isMonomial(expr):
+  """Product of numbers and symbols in positive integer powers"""
+  for v in sympy.Mul.make_args(expr):
+    if not (v.is_Symbol or v.is_Rational or
+        v.is_Pow and v.base.is_Symbol and v.exp.is_Integer and v.exp > 0):
+      return False
+  return True
+
+def _expand(expr):
+  try:
+    return _polyElement(expr).as_expr()
+  except (_NotPolynomial, RecursionError):
+    return sympy.expand(expr)
+
+def _factor(expr):
+  try:
+    p = _polyElement(expr)
+  except (_NotPolynomial, RecursionError):
+    return sympy.factor(expr)
+  den = 1
+  if p.ring.domain == sympy.QQ:
+    den, p = p.clear_denoms()
+    p = p.set_ring(p.ring.clone(domain=sympy.ZZ))
+  coeff, factors = p.factor_list()
+  # the coefficient is not distributed into the sum, as in sympy.factor
+  from sympy.core.mul import _keep_coeff
+  return _keep_coeff(sympy.Rational(int(coeff), int(den)),
+                     sympy.Mul(*[f.as_expr()**k for f, k in factors]))
+
+def _collect(expr, arg):
+  if not (isinstance(expr, sympy.Expr) and expr.is_Add and all(_isMonomial(v) for v in expr.args)):
+    return sympy.collect(expr, arg)    # not expanded polynomial
+  try:
+    p = _polyElement(expr)
+    i = p.ring.symbols.index(sympy.Symbol(arg))
+  except (_NotPolynomial, RecursionError, ValueError):
+    return sympy.collect(expr, arg)
+  groups = {}
+  for monom, coeff in p.terms():
+    rest = monom[:i] + (0,) + monom[i+1:]
+    groups[monom[i]] = groups.get(monom[i], p.ring.zero) + p.ring({rest: coeff})
+  v = p.ring.symbols[i]
+  return sympy.Add(*[g.as_expr() * v**k for k, g in groups.items()])
+
+def _cancel(expr):
+  try:
+    f = _polyElement(expr, field=True)
+  except (_NotPolynomial, RecursionError, ZeroDivisionError):
+    return sympy.cancel(expr)
+  num, den = f.numer, f.denom
+  if den.LC < 0:
+    num, den = -num, -den   # positive leading coefficient, as in sympy.cancel
+  return num.as_expr() / den.as_expr()
+
+def _subs(expr, a, b):
+  return expr.subs(a, b)
+
+def _evalf(expr):
+  return expr.evalf()
+
+def _expandPowerBase(expr):
+  return sympy.expand_power_base(expr, force=True)
+
+def _logCombine(expr):
+  return sympy.logcombine(expr, force=True)
+
+# expression functions of the operations, sympy names or local functions;
+# expand, factor, collect and cancel use polynomial rings when possible
+FUNCTIONS = {
+  'expand': _expand, 'factor': _factor, 'simplify': 'simplify',
+  'collect': _collect, 'subs': _subs, 'evalf': _evalf,
+  'trigExpand': 'expand_trig', 'trigSimp': 'trigsimp',
+  'powExpandExp': 'expand_power_exp', 'powExpandBase': _expandPowerBase,
+  'powSimp': 'powsimp', 'powDenest': 'powdenest',
+  'cancel': _cancel, 'apart': 'apart',
+  'logExpand': 'expand_log', 'logCombine': _logCombine,
+}
+
+# operations with the ring fast path, the ring normalizes the input,
+# so the unevaluated one (Evaluate is off) goes to the sympy function
+RING_OPERATIONS = ('expand', 'factor', 'collect', 'cancel')
+
+# ====== SymEngine backend ======
+
+BACKENDS = ('sympy', 'auto', 'symengine')
+SYMENGINE_MIN = 200     # input length from which 'auto' uses SymEngine
+
+_symengine = None
+
+def _symengineModule():
+  """Import symengine or get None when it is not installed"""
+  global _symengine
+  if _symengine is None:
+    try:
+      _symengine = importlib.import_module('symengine')
+    except ImportError:
+      _symengine = False
+  return _symengine or None
+
+def hasSymengine():
+  """Check if the SymEngine backend is available"""
+  return _symengineModule() is not None
+
+def _isSymengine(expr):
+  """Expression is SymEngine object, checked without import"""
+  # module is None for the undefined functions like f(x)
+  return (type(expr).__module__ or '').startswith('symengine')
+
+def _seExpand(expr):
+  return _symengine.expand(expr)
+
+def _seSubs(expr, a, b):
+  return expr.subs({_symengine.Symbol(a): _symengine.sympify(b)})
+
+def _seEvalf(expr):
+  return expr.n()
+
+# operations which have SymEngine implementation,
+# the others convert the expression to sympy
+SYMENGINE_FUNCTIONS = {'expand': _seExpand, 'subs': _seSubs, 'evalf': _seEvalf}
+
+def backends(name):
+  """Backends which support the operation"""
+  return ('sympy', 'symengine') if name in SYMENGINE_FUNCTIONS else ('sympy',)
+
+_operations = None
+
+def _operation(fn):
+  """Name of the operation for the expression function"""
+  global _operations
+  if _operations is None:
+    _operations = {_function(k): k for k in FUNCTIONS}
+  return _operations.get(fn)
+
+def _xorPrinter():
+  """Printer which writes power as '^' directly"""
+  from sympy.printing.str import StrPrinter
+  from sympy.printing.precedence import precedence
+
+  class XorPrinter(StrPrinter):
+    def _print_Pow(self, expr, rational=False):
+      if not rational and (expr.exp is sympy.S.Half or
+          expr.is_commutative and (-expr.exp is sympy.S.Half or expr.exp is sympy.S.NegativeOne)):
+        return super()._print_Pow(expr, rational)   # sqrt or division
+      prec = precedence(expr)
+      return '%s^%s' % (self.parenthesize(expr.base, prec, strict=False),
+                        self.parenthesize(expr.exp, prec, strict=False))
+
+  return XorPrinter()
+
+_printers = {}
+
+def _printer(xor):
+  """Get string printer for the power settings"""
+  p = _printers.get(xor)
+  if p is None:
+    p = _printers[xor] = _xorPrinter() if xor else sympy.StrPrinter()
+  return p
+
+def _function(name):
+  """Get expression function for the operation"""
+  fn = FUNCTIONS[name]
+  return getattr(sympy, fn) if isinstance(fn, str) else fn
+
 
 class Sym:
   """Interface for symbolical operations"""
 
   def __init__(self):
-    self._transform = standard_transformations + (convert_xor,)
+    self._transform = None     # get on the first parsing
     self._xor = True
     self._simp = False
+    self._cse = False
+    self._backend = 'sympy'
+    self._parsed = LruCache(PARSE_SIZE, PARSE_MEM)
+    self._results = LruCache(RESULT_SIZE, RESULT_MEM)
+    self._store = None         # persistent cache
+    self._doc = None           # definitions of the document
 
   # ====== properties ========
 
   def simpParse(self,use):
     """Simplify expression during the parsing"""
     self._simp = use
+    self.clearCache()
 
   def powXOR(self,use):
     """Use '^' as a power symbol"""
     self._xor = use
-    if use:  # symbol ^
-      self._transform = standard_transformations + (convert_xor,)
-    else:    # symbol **
-      self._transform = standard_transformations
+    self.clearCache()
+    self._transform = None
+
+  def compact(self, use):
+    """Print common subexpressions as separate assignments"""
+    self._cse = use
+    self._results.clear()
+
+  def persist(self, use):
+    """Keep results in the cache on disk"""
+    if use and self._store is None:
+      self._store = ResultStore()
+    elif not use and self._store is not None:
+      self._store.close()
+      self._store = None
+
+  def setBackend(self, name):
+    """Choose 'sympy' (default), 'symengine' or 'auto': SymEngine computes
+    long evaluated inputs, the result is printed by sympy as usual.
+    Operations without SymEngine implementation always use sympy."""
+    if name not in BACKENDS:
+      raise ValueError("Unknown backend '%s'" % name)
+    self._backend = name
+    self._results.clear()    # results are printed differently
+
+  def getSettings(self):
+    """Current parser and printer settings"""
+    return {'simp': self._simp, 'xor': self._xor, 'cse': self._cse,
+            'store': self._store is not None, 'backend': self._backend}
+
+  def setSettings(self, st):
+    """Apply settings obtained from getSettings"""
+    if st['simp'] != self._simp:
+      self.simpParse(st['simp'])
+    if st['xor'] != self._xor:
+      self.powXOR(st['xor'])
+    if st['cse'] != self._cse:
+      self.compact(st['cse'])
+    if st['store'] != (self._store is not None):
+      self.persist(st['store'])
+    if st['backend'] != self._backend:
+      self.setBackend(st['backend'])
+
+  def clearCache(self):
+    """Forget parsed expressions and results"""
+    self._parsed.clear()
+    self._results.clear()
+
+  def cacheStats(self):
+    """Statistics for parser and result caches"""
+    return {'parse': self._parsed.stats(), 'result': self._results.stats()}
 
   # ====== internal ========
 
+  def _getTransform(self):
+    """Parser transformations for the current settings"""
+    if self._transform is None:
+      if self._xor:  # symbol ^
+        self._transform = _parser.standard_transformations + (_parser.convert_xor,)
+      else:          # symbol **
+        self._transform = _parser.standard_transformations
+    return self._transform
+
   def _parse(self, s):
     """Get sympy expression from the string"""
-    try:
-      expr = parse_expr(s, evaluate=self._simp, transformations=self._transform)
+    key = (s, self._simp, self._xor)
+    expr = self._parsed.get(key)
+    if expr is not None:
       return True, expr
-    except Exception as err:
+    from .fastparse import parse, Unsupported
+    try:
+      expr = parse(s, self._xor, self._simp)
+    except Unsupported:
+      try:
+        expr = _parser.parse_expr(s, evaluate=self._simp, transformations=self._getTransform())
+      except Exception as err:
+        return False, err
+    except Exception as err:   # the same errors as in parse_expr
       return False, err
+    self._parsed.put(key, expr, EXPR_CHAR_MEM * len(s))
+    return True, expr
 
-  def _toString(self, expr):
+  def _useSymengine(self, s, name):
+    """Check if the operation on the string is done with SymEngine"""
+    if self._backend == 'sympy' or name not in SYMENGINE_FUNCTIONS:
+      return False
+    if self._backend == 'auto' and (not self._simp or len(s) < SYMENGINE_MIN):
+      return False    # SymEngine always evaluates the input
+    if not self._xor and '^' in s:
+      return False    # logical xor for sympy, power for SymEngine
+    return hasSymengine()
+
+  def _parseFor(self, s, name):
+    """Get SymEngine expression if the operation uses it, otherwise sympy one"""
+    if self._useSymengine(s, name):
+      key = (s, 'symengine')
+      expr = self._parsed.get(key)
+      if expr is not None:
+        return True, expr
+      try:
+        expr = _symengine.sympify(s)
+      except Exception:
+        pass    # sympy gives the error message
+      else:
+        self._parsed.put(key, expr, EXPR_CHAR_MEM * len(s))
+        return True, expr
+    return self._parse(s)
+
+  def _call(self, name, expr, args):
+    """Apply operation, SymEngine expression is converted
+    to sympy if the operation has no SymEngine implementation"""
+    if _isSymengine(expr):
+      fn = SYMENGINE_FUNCTIONS.get(name)
+      if fn is not None:
+        return fn(expr, *args)
+      with perf.span('sym.convert'):
+        expr = sympy.sympify(expr)
+    if not self._simp and name in RING_OPERATIONS:
+      return getattr(sympy, name)(expr, *args)
+    return _function(name)(expr, *args)
+
+  def _print(self, expr):
     """Convert expression to string"""
-    s = str(expr)
-    if self._xor:
-      s = s.replace('**','^')
-    return s
+    if _isSymengine(expr):
+      res = str(expr)
+      return res.replace('**', '^') if self._xor else res
+    if isinstance(expr, sympy.MatrixBase) and 0 not in expr.shape:
+      # one line as str() of the matrix, not the table of StrPrinter
+      return 'Matrix(%s)' % self._print(expr.tolist())
+    return _printer(self._xor).doprint(expr)
 
-  def _eval(self, s, fn):
-    """Parse string and apply function"""
-    ok, res = self._parse(s)
+  def _toString(self, expr):
+    """Convert result to string, in compact mode the common
+    subexpressions are written as 'name = expr' lines before it"""
+    if _isSymengine(expr) and (self._cse or self._backend == 'auto'):
+      # 'auto' keeps the sympy order of terms
+      with perf.span('sym.convert'):
+        expr = sympy.sympify(expr)
+    if not self._cse:
+      return self._print(expr)
+    with perf.span('sym.cse'):
+      names = sympy.numbered_symbols('s', exclude=expr.free_symbols)
+      subs, (red,) = sympy.cse(expr, symbols=names)
+    lines = ['%s = %s' % (v, self._print(e)) for v, e in subs]
+    lines.append(self._print(red))
+    return '\n'.join(lines)
+
+  def _apply(self, s, fn, args=()):
+    """Parse string, apply function and get result as string"""
+    name = _operation(fn)
+    with perf.span('sym.parse'):
+      ok, res = self._parseFor(s, name)
     if not ok:
       return False, res
-    expr = fn(res)
-    return True, self._toString(expr)
+    if _isSymengine(res):
+      fn = SYMENGINE_FUNCTIONS[name]
+    elif not self._simp and name in RING_OPERATIONS:
+      fn = getattr(sympy, name)
+    key = self._resultKey(s, res, fn.__name__, args)
+    out = self._results.get(key)
+    if out is None:
+      out = self._load(s, fn.__name__, args)
+      if out is None:
+        with perf.span('sym.' + fn.__name__):
+          expr = fn(res, *args)
+        with perf.span('sym.print'):
+          out = self._toString(expr)
+        self._save(s, fn.__name__, args, out)
+      self._results.put(key, out, sys.getsizeof(out))
+    return True, out
+
+  def _resultKey(self, s, expr, name, args):
+    """Key for the result cache: the expression, so the same input written
+    differently is found too, or the source for unhashable objects (matrices)"""
+    try:
+      hash(expr)
+    except TypeError:
+      return (s, self._simp, self._xor), name, args
+    return expr, name, args
+
+  def _storeKey(self, s, name, args):
+    """Key for the persistent cache"""
+    version = sympy.__version__
+    if hasSymengine():
+      version += '/' + _symengine.__version__
+    return makeKey(s, name, args, {'simp': self._simp, 'xor': self._xor, 'cse': self._cse,
+                   'backend': self._backend}, version)
+
+  def _load(self, s, name, args):
+    """Find result in the persistent cache"""
+    if self._store is None:
+      return None
+    with perf.span('sym.store'):
+      return self._store.get(self._storeKey(s, name, args))
+
+  def _save(self, s, name, args, out):
+    """Put result to the persistent cache"""
+    if self._store is not None:
+      with perf.span('sym.store'):
+        self._store.put(self._storeKey(s, name, args), out)
+
+  def _eval(self, s, fn):
+    """Parse string and apply function"""
+    return self._apply(s, fn)
 
   def _eval_arg(self, s, fn, arg):
     """Parse string and apply function with additional parameter"""
-    ok, res = self._parse(s)
-    if not ok:
-      return False, res
-    expr = fn(res, arg)
-    return True, self._toString(expr)
+    return self._apply(s, fn, (arg,))
 
   def subs(self, s, a, b):
     """Parse string and substitute variable"""
-    ok, res = self._parse(s)
-    if not ok:
-      return False, res
-    expr = res.subs(a,b)
-    return True, self._toString(expr)
+    return self._apply(s, _subs, (a, b))
 
   def evalf(self, s):
     """Parse string and evaluate float value"""
-    ok, res = self._parse(s)
+    return self._apply(s, _evalf)
+
+  def pipeline(self, s, ops):
+    """Parse string once, apply sequence of (name, args) operations
+    to the expression and print the result"""
+    ops = tuple((name, tuple(args)) for name, args in ops)
+    with perf.span('sym.parse'):
+      ok, res = self._parseFor(s, ops[0][0] if ops else None)
     if not ok:
       return False, res
-    expr = res.evalf()
-    return True, self._toString(expr)
+    # SymEngine and sympy results are printed differently
+    tag = 'pipeline.symengine' if _isSymengine(res) else 'pipeline'
+    key = self._resultKey(s, res, tag, ops)
+    out = self._results.get(key)
+    if out is None:
+      out = self._load(s, tag, ops)
+      if out is None:
+        expr = res
+        for name, args in ops:
+          with perf.span('sym.' + name):
+            expr = self._call(name, expr, args)
+        with perf.span('sym.print'):
+          out = self._toString(expr)
+        self._save(s, tag, ops, out)
+      self._results.put(key, out, sys.getsizeof(out))
+    return True, out
+
+  def _document(self, lines):
+    """Update definitions from the document lines"""
+    from .document import Document
+    if self._doc is None:
+      self._doc = Document(self)
+    with perf.span('sym.definitions'):
+      self._doc.update(lines)
+    return self._doc
+
+  def defsExpand(self, s, lines):
+    """Substitute definitions 'name = expr' from the lines into the string"""
+    return self._document(lines).expand(s)
+
+  def defsEvaluate(self, s, lines):
+    """Get all the definitions from the lines with substituted values"""
+    doc = self._document(lines)
+    res = doc.evaluate()
+    if doc.errors:
+      res += '\n\n' + '\n'.join(doc.errors)
+    return True, res
+
+  def grid(self, s, spec, path=''):
+    """Evaluate expression over ranges like 'x=0:1:11, y=[1,2]',
+    add table or statistics after the expression"""
+    from .grid import evaluate
+    with perf.span('sym.parse'):
+      ok, res = self._parse(s)
+    if not ok:
+      return False, res
+    try:
+      out = evaluate(res, spec, path)
+    except (ValueError, OSError) as err:
+      return False, err
+    return True, s + '\n' + out
+
+  def version(self, s=''):
+    """Load sympy and get its version"""
+    return True, sympy.__version__
 
   # ======= base ===========
 
   def expand(self,s):
     """Expand expression"""
-    return self._eval(s, sympy.expand)
+    return self._eval(s, _expand)
 
   def factor(self,s):
     """Factorise expression"""
-    return self._eval(s, sympy.factor)
+    return self._eval(s, _factor)
 
   def simplify(self,s):
     """Apply all avilable simplifications"""
@@ -92,7 +650,7 @@ class Sym:
 
   def collect(self, s, arg):
     """Collect common powers"""
-    return self._eval_arg(s, sympy.collect, arg)
+    return self._eval_arg(s, _collect, arg)
 
   # ===== trigonometry ======
 
@@ -112,7 +670,7 @@ class Sym:
 
   def powExpandBase(self,s):
     """Expand power base"""
-    return self._eval(s, lambda x:sympy.expand_power_base(x,force=True))
+    return self._eval(s, _expandPowerBase)
 
   def powSimp(self, s):
     """Simplify expression with powers"""
@@ -126,7 +684,7 @@ class Sym:
 
   def cancel(self,s):
     """Get standard canonical form of rational function"""
-    return self._eval(s, sympy.cancel)
+    return self._eval(s, _cancel)
 
   def apart(self,s):
     """Partial fractional decomposition"""
@@ -140,4 +698,4 @@ class Sym:
 
   def logCombine(self,s):
     """Combine logarithm expression"""
-    return self._eval(s, lambda x: sympy.logcombine(x,force=True))
+    return self._eval(s, _logCombine)
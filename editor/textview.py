@@ -0,0 +1,163 @@
+# Text widget with notifications about the modified lines
+
+import bisect
+import tkinter as tk
+
+TAG_ARGS = 2000     # index pairs in one tag_add call
+
+def _commonPrefix(a, b):
+  """Length of the common beginning, slices are compared by halves"""
+  lo, hi = 0, min(len(a), len(b))
+  while lo < hi:
+    mid = (lo + hi + 1) // 2
+    if a[lo:mid] == b[lo:mid]:
+      lo = mid
+    else:
+      hi = mid - 1
+  return lo
+
+def _commonSuffix(a, b, limit):
+  """Length of the common end, not longer than limit"""
+  lo, hi = 0, limit
+  while lo < hi:
+    mid = (lo + hi + 1) // 2
+    if a[len(a)-mid:len(a)-lo] == b[len(b)-mid:len(b)-lo]:
+      lo = mid
+    else:
+      hi = mid - 1
+  return lo
+
+def _index(txt, off):
+  """Text index for the offset in the string"""
+  return '%d.%d' % (txt.count('\n', 0, off) + 1, off - txt.rfind('\n', 0, off) - 1)
+
+def diffEdits(old, new):
+  """Operations which convert the old text to the new one,
+  only the changed middle part is replaced"""
+  p = _commonPrefix(old, new)
+  q = _commonSuffix(old, new, min(len(old), len(new)) - p)
+  res = []
+  if p < len(old) - q:
+    res.append(('delete', _index(old, p), _index(old, len(old) - q)))
+  if p < len(new) - q:
+    res.append(('insert', _index(old, p), new[p:len(new)-q]))
+  return res
+
+class TextView(tk.Text):
+  """Text widget which reports changes of its content"""
+
+  def __init__(self, master, **kw):
+    super().__init__(master, **kw)
+    self._listeners = []
+    self._editListeners = []
+    self.generation = 0     # number of changes
+    self._content = None
+    self._starts = None
+    # intercept the widget command to see all insertions and deletions
+    self._orig = self._w + '_orig'
+    self.tk.call('rename', self._w, self._orig)
+    self.tk.createcommand(self._w, self._proxy)
+
+  def addListener(self, fn):
+    """Call fn(line, nold, nnew) after the lines [line, line+nold)
+    have been replaced with the lines [line, line+nnew)"""
+    self._listeners.append(fn)
+
+  def addEditListener(self, fn):
+    """Call fn('insert', index, chars) and fn('delete', beg, end) after
+    the change with the numeric indices as they were before it (undo and
+    redo are reported as such operations too), or fn('reset') when
+    the change positions are unknown"""
+    self._editListeners.append(fn)
+
+  def lineCount(self):
+    """Number of lines in the text"""
+    return self._line('end - 1c')
+
+  def content(self):
+    """Text without the final newline, cached until the next change"""
+    if self._content is None:
+      self._content = self.tk.call(self._orig, 'get', '1.0', 'end - 1c')
+    return self._content
+
+  def offsetIndex(self, off):
+    """Convert offset in content() to the text index"""
+    if self._starts is None:
+      txt = self.content()
+      starts, i = [0], txt.find('\n')
+      while i >= 0:
+        starts.append(i + 1)
+        i = txt.find('\n', i + 1)
+      self._starts = starts
+    n = bisect.bisect_right(self._starts, off)
+    return '%d.%d' % (n, off - self._starts[n-1])
+
+  def indexOffset(self, index):
+    """Convert text index to the offset in content()"""
+    line, col = map(int, str(self.tk.call(self._orig, 'index', index)).split('.'))
+    self.offsetIndex(0)   # update line starts
+    return self._starts[line-1] + col
+
+  def tagAddAll(self, tag, indices):
+    """Add tag for the list of index pairs with few Tcl calls"""
+    for i in range(0, len(indices), 2*TAG_ARGS):
+      self.tag_add(tag, *indices[i:i+2*TAG_ARGS])
+
+  def _line(self, index):
+    """Line number for the index"""
+    return int(str(self.tk.call(self._orig, 'index', index)).split('.')[0])
+
+  def _notify(self, line, nold, nnew):
+    """Call listeners"""
+    self._content = self._starts = None
+    self.generation += 1
+    for fn in self._listeners:
+      fn(line, nold, nnew)
+
+  def _edits(self, cmd, args):
+    """Describe command for the edit listeners before its execution"""
+    index = lambda i: str(self.tk.call(self._orig, 'index', i))
+    if cmd == 'insert':
+      return [('insert', index(args[0]), ''.join(args[1::2]))]
+    if cmd == 'delete' and len(args) <= 2:
+      beg = index(args[0])
+      end = index(args[1] if len(args) > 1 else beg + ' + 1c')
+      return [('delete', beg, end)]
+    if cmd == 'replace':
+      beg, end = index(args[0]), index(args[1])
+      return [('delete', beg, end), ('insert', beg, ''.join(args[2::2]))]
+    return [('reset',)]
+
+  def _proxy(self, cmd, *args):
+    """Execute widget command and find modified lines"""
+    if cmd not in ('insert', 'delete', 'replace', 'edit'):
+      return self.tk.call((self._orig, cmd) + args)
+    n0 = self.lineCount()
+    edits = self._edits(cmd, args) if self._editListeners and cmd != 'edit' else []
+    if cmd == 'insert':
+      line = min(self._line(args[0]), n0)
+      res = self.tk.call((self._orig, cmd) + args)
+      self._notify(line, 1, 1 + self.lineCount() - n0)
+    elif cmd in ('delete', 'replace'):
+      idx = args if cmd == 'delete' else args[:2]
+      if len(idx) == 1:
+        # single character, it can be the newline which joins two lines
+        idx = (idx[0], idx[0] + ' + 1c')
+      lines = [self._line(i) for i in idx]
+      line, last = min(min(lines), n0), min(max(lines), n0)
+      nold = last - line + 1
+      res = self.tk.call((self._orig, cmd) + args)
+      self._notify(line, nold, nold + self.lineCount() - n0)
+    else:
+      undo = args and args[0] in ('undo', 'redo')
+      old = self.content() if undo and self._editListeners else None
+      res = self.tk.call((self._orig, cmd) + args)
+      if undo:
+        # positions are unknown, report the whole text
+        self._notify(1, n0, self.lineCount())
+        if old is not None:
+          edits = diffEdits(old, self.content())
+    for fn in self._editListeners:
+      for ev in edits:
+        fn(*ev)
+    return res
@@ -3,4 +3,5 @@
 from tkinter import Tk
 from editor import Editor
 
-Editor(Tk(), "0.1.3")
+if __name__ == "__main__":
+  Editor(Tk(), "0.1.3")
@@ -0,0 +1,41 @@
+import json
+import os
+import selectors
+import socket
+
+from editor.daemon import Server, _Client, connect
+
+
+def _server(tmp_path):
+  srv = Server(str(tmp_path / 'daemon.sock'), nproc=1)
+  a, b = socket.socketpair()
+  a.setblocking(False)
+  client = _Client(a)
+  srv._sel.register(a, selectors.EVENT_READ, client)
+  return srv, client, b
+
+def _send(srv, client, peer, lines):
+  peer.sendall(b''.join(v + b'\n' for v in lines))
+  srv._read(client)
+  if client.sock.fileno() >= 0:
+    srv._write(client)
+
+def test_bad_requests(tmp_path):
+  srv, client, peer = _server(tmp_path)
+  _send(srv, client, peer, [b'{}', b'{"id": 1, "op": "unlink", "s": "x"}',
+    b'{"id": 2, "op": "expand", "s": 1}', b'{"id": 3, "op": "expand", "s": "x", "args": 5}',
+    b'{"cancel": "x"}'])
+  replies = [json.loads(v) for v in peer.recv(1 << 16).splitlines()]
+  assert [(v['id'], v['ok']) for v in replies] == [(None, False), (1, False), (2, False), (3, False)]
+  assert not srv.pending and client.sock.fileno() >= 0
+
+def test_not_dict_drops_client(tmp_path):
+  srv, client, peer = _server(tmp_path)
+  _send(srv, client, peer, [b'[1, 2]'])
+  assert client.sock.fileno() < 0
+
+def test_connect_requires_owner(tmp_path, monkeypatch):
+  path = tmp_path / 'daemon.sock'
+  path.write_text('')
+  monkeypatch.setattr(os, 'getuid', lambda: os.stat(path).st_uid + 1)
+  assert connect(str(path)) is None
@@ -0,0 +1,36 @@
+from editor.symbolic import Sym
+
+
+def test_evaluate():
+  ok, res = Sym().defsEvaluate('', ['a = x^2 + 1', 'b = 2*a', 'c = b - a'])
+  assert ok
+  assert res.split('\n') == ['a = x^2 + 1', 'b = 2*x^2 + 2', 'c = x^2 + 1']
+
+
+def test_long_chain():
+  lines = ['a0 = x'] + ['a%d = a%d + 1' % (i, i - 1) for i in range(1, 3000)]
+  assert Sym().defsExpand('y = a2999', lines) == (True, 'y = x + 2999')
+
+
+def test_cycle():
+  ok, res = Sym().defsEvaluate('', ['p = q + 1', 'q = 2*p'])
+  assert 'p: Cyclic definition: p -> q -> p' in res
+
+
+def test_update_dependents():
+  sym = Sym()
+  lines = ['a = x', 'b = a + 1', 'c = y', 'd = 2*c']
+  sym.defsEvaluate('', lines)
+  doc = sym._doc
+  kept = doc._resolved['d']
+  doc.update(['a = x + 1'] + lines[1:])
+  assert set(doc._resolved) == {'c', 'd'} and doc._resolved['d'] is kept
+  assert sym.defsEvaluate('', ['a = x + 1'] + lines[1:]) == \
+    (True, 'a = x + 1\nb = x + 2\nc = y\nd = 2*y')
+
+
+def test_settings_reset():
+  sym = Sym()
+  assert sym.defsExpand('y = a', ['a = x**2']) == (True, 'y = x^2')
+  sym.powXOR(False)
+  assert sym.defsExpand('y = a', ['a = x**2']) == (True, 'y = x**2')
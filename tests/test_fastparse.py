@@ -0,0 +1,42 @@
+import pytest
+
+from editor.symbolic import sympy, _parser
+from editor import fastparse
+from benchmarks.bench_parse import SAMPLES
+from benchmarks.corpus import corpus
+
+# inputs close to the grammar limits
+EDGE = [
+  '1.', '1.e5', '1e5', '.5e-2', '0', '0.0', '00', '1 2', 'x y', '2 x', '(2)(3)',
+  'x**-y', 'x^-y^-z', '-x**-2', '2**3**2', '(-2)^2', '-(2)^2', '- - - x', '+-x', '-+x',
+  'x/-y', 'x*+y', '1/2/3', '2/3*x', 'x/2/y', '(x/y)/(z/w)', '1 - 2 - 3', 'a - -b',
+  'sin(x, y)', 'sin()', 'log(x, )', 'exp(exp(exp(x)))', 'sqrt(-1)', 'cbrt(8)',
+  'sin(x)(y)', 'pi(x)', 'E*E', 'I^2', 'oo - oo', '0*oo', 'x^0', '0^0', '1/0', '0/0',
+  'x_1^2', '_x', 'x__y', 'Sum', 'Symbol', 'print', 'if', 'None', 'True + 1',
+  '  x  +  1  ', '\tx', 'x\n', '(x + (y - (z * (w / 2))))', 'x,y', '()', 'x ** ** y',
+]
+
+def _result(fn):
+  """srepr of the expression or type of the exception"""
+  try:
+    return sympy.srepr(fn())
+  except fastparse.Unsupported:
+    raise
+  except Exception as err:
+    return type(err)
+
+def _items():
+  groups = corpus()
+  return SAMPLES + EDGE + [s for v in groups.values() for _, s in v]
+
+@pytest.mark.parametrize('evaluate', [True, False])
+@pytest.mark.parametrize('xor', [True, False])
+@pytest.mark.parametrize('s', _items())
+def test_same_as_parse_expr(s, xor, evaluate):
+  try:
+    fast = _result(lambda: fastparse.parse(s, xor, evaluate))
+  except fastparse.Unsupported:
+    return    # processed by parse_expr
+  trans = _parser.standard_transformations + ((_parser.convert_xor,) if xor else ())
+  ref = _result(lambda: _parser.parse_expr(s, evaluate=evaluate, transformations=trans))
+  assert fast == ref
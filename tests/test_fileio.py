@@ -0,0 +1,64 @@
+from editor import fileio
+from editor.bigfile import LineIndex
+
+
+class FakeText:
+  """Part of the text widget used by FileLoader"""
+
+  def __init__(self):
+    self.s = ''
+    self.idle = []
+
+  def configure(self, **kw):
+    pass
+
+  def after_idle(self, fn):
+    self.idle.append(fn)
+    return len(self.idle)
+
+  def insert(self, index, s):
+    self.s += s
+
+  def edit_reset(self):
+    pass
+
+  def run(self):
+    while self.idle:
+      self.idle.pop(0)()
+
+
+def _load(path):
+  text, res = FakeText(), {}
+  loader = fileio.FileLoader(text, str(path), done=lambda d: res.update(done=d),
+    failed=lambda msg: res.update(failed=msg))
+  loader.start()
+  text.run()
+  return text.s, res
+
+
+def test_load(tmp_path, monkeypatch):
+  monkeypatch.setattr(fileio, 'encoding', lambda: 'utf-8')
+  path = tmp_path / 'a.txt'
+  path.write_bytes('x\r\né\n'.encode('utf-8'))
+  s, res = _load(path)
+  assert s == 'x\né\n' and 'done' in res
+
+
+def test_undecodable(tmp_path, monkeypatch):
+  monkeypatch.setattr(fileio, 'encoding', lambda: 'utf-8')
+  path = tmp_path / 'a.txt'
+  path.write_bytes(b'abc\xff\n')
+  _, res = _load(path)
+  assert res == {'failed': 'not utf-8 text, wrong byte at offset 3'}
+
+
+def test_index_damaged(tmp_path):
+  path = tmp_path / 'a.txt'
+  path.write_bytes(b'abc\n\xff\n')
+  index = LineIndex(str(path))
+  index.enc = 'utf-8'
+  while not index.step():
+    pass
+  assert index.lines(0, 1) == ['abc'] and not index.damaged
+  assert index.lines(1, 2) == ['\ufffd'] and index.damaged
+  index.close()
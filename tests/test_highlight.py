@@ -0,0 +1,87 @@
+import pytest
+
+from editor.highlight import BracketIndex
+
+
+class FakeText:
+  """Minimal part of TextView used by the highlighters"""
+
+  def __init__(self, txt):
+    self.lines = txt.split('\n')
+    self.listeners = []
+
+  def addListener(self, fn):
+    self.listeners.append(fn)
+
+  def lineCount(self):
+    return len(self.lines)
+
+  def _pos(self, index):
+    line, col = index.split('.')
+    line = int(line)
+    return line, len(self.lines[line-1]) if col == 'end' else int(col)
+
+  def index(self, index):
+    return '%d.%d' % self._pos(index)
+
+  def get(self, beg, end):
+    (l1, c1), (l2, c2) = self._pos(beg), self._pos(end)
+    txt = '\n'.join(self.lines[l1-1:l2])
+    return txt[c1:len(txt) - len(self.lines[l2-1]) + c2]
+
+  def after(self, ms, fn):
+    return 'after'
+
+  def after_cancel(self, key):
+    pass
+
+  def change(self, line, nold, new):
+    """Replace lines and notify as TextView does"""
+    self.lines[line-1:line-1+nold] = new
+    for fn in self.listeners:
+      fn(line, nold, len(new))
+
+
+def test_balanced():
+  text = FakeText('(x\n+1)')
+  idx = BracketIndex(text, 'bad')
+  assert idx.check('1.0', '2.end') is None
+  assert idx.check('1.0', '1.end') == '1.0'
+
+
+def test_join_lines():
+  text = FakeText('a\n(x\n+1)\nb')
+  idx = BracketIndex(text, 'bad')
+  assert idx.check('1.0', '4.end') is None
+  # backspace at the beginning of the third line
+  text.change(2, 2, ['(x+1)'])
+  assert idx.check('2.0', '2.end') is None
+  assert idx.pair(2, 0) == (2, 4)
+
+
+def test_split_line():
+  text = FakeText('(x+1)')
+  idx = BracketIndex(text, 'bad')
+  idx.check('1.0', '1.end')
+  text.change(1, 1, ['(x', '+1)'])
+  assert idx.check('1.0', '2.end') is None
+  assert idx.check('2.0', '2.end') == '2.2'
+
+
+def test_textview_join_report():
+  tk = pytest.importorskip('tkinter')
+  try:
+    root = tk.Tk()
+  except tk.TclError:
+    pytest.skip("no display")
+  from editor.textview import TextView
+  try:
+    text = TextView(root)
+    text.insert('1.0', '(x\n+1)')
+    reports = []
+    text.addListener(lambda *v: reports.append(v))
+    text.delete('1.2')    # newline at the end of the first line
+    assert reports == [(1, 2, 1)]
+    assert BracketIndex(text, 'bad').check('1.0', '1.end') is None
+  finally:
+    root.destroy()
@@ -0,0 +1,60 @@
+import pytest
+import sympy
+
+from editor.symbolic import Sym
+
+
+def test_collect_numbers():
+  assert Sym().collect('1 + 2', 'x') == (True, '3')
+
+
+def test_collect_polynomial():
+  assert Sym().collect('x^2*y + x^2 + x*y + 3', 'x') == (True, 'x^2*(y + 1) + x*y + 3')
+
+
+def test_backend_default_sympy():
+  sym = Sym()
+  assert sym.getSettings()['backend'] == 'sympy'
+  long = ' + '.join('(x + %d)^2*y' % i for i in range(20))
+  assert not sym._useSymengine(long, 'expand')
+  sym.setBackend('auto')
+  assert not sym._useSymengine(long, 'expand')   # input is not evaluated
+
+
+def test_print_matrix():
+  x = sympy.Symbol('x')
+  assert Sym()._print(sympy.Matrix([[x**2, 1], [1, x]])) == 'Matrix([[x^2, 1], [1, x]])'
+
+
+def test_matrix_result():
+  sym = Sym()
+  for _ in range(2):
+    assert sym.simplify('Matrix([[x,1],[1,x]])') == (True, 'Matrix([[x, 1], [1, x]])')
+  assert sym.pipeline('Matrix([[x,1],[1,x]])', [('simplify', ())]) == \
+    (True, 'Matrix([[x, 1], [1, x]])')
+
+
+def test_undefined_function():
+  assert Sym().expand('f(x)') == (True, 'f(x)')
+
+
+@pytest.mark.parametrize('op, s, res', [
+  ('factor', 'x^2-1, x^2-4', '((x - 1)*(x + 1), (x - 2)*(x + 2))'),
+  ('expand', 'Sum(x,(x,1,n))', 'Sum(x, (x, 1, n))'),
+  ('cancel', 'Eq(x,y)', 'Eq(x, y)'),
+  ('expand', 'Matrix([[x,1],[1,x]])', 'Matrix([[x, 1], [1, x]])'),
+])
+def test_generic_path(op, s, res):
+  assert getattr(Sym(), op)(s) == (True, res)
+
+
+def test_collect_generic_path():
+  assert Sym().collect('Sum(x,(x,1,n))', 'x') == (True, 'Sum(x, (x, 1, n))')
+
+
+def test_unevaluated_kept():
+  sym = Sym()
+  sym.simpParse(False)
+  assert sym.expand('x^1 + z^0') == (True, 'x^1 + z^0')
+  assert sym.cancel('x^0') == (True, 'x^0')
+  assert sym.pipeline('x^0', [('expand', ())]) == (True, 'x^0')
@@ -0,0 +1,35 @@
+import random
+
+from editor.textview import diffEdits
+
+
+def _apply(txt, edits):
+  """Apply operations with 'line.col' indices to the string"""
+  def offset(index):
+    line, col = map(int, index.split('.'))
+    return sum(len(v) + 1 for v in txt.split('\n')[:line-1]) + col
+  for op in edits:
+    if op[0] == 'delete':
+      beg, end = offset(op[1]), offset(op[2])
+      txt = txt[:beg] + txt[end:]
+    else:
+      beg = offset(op[1])
+      txt = txt[:beg] + op[2] + txt[beg:]
+  return txt
+
+
+def test_diff_small():
+  assert diffEdits('ab\ncd', 'ab\ncd') == []
+  assert diffEdits('ab\ncd', 'ab\nxcd') == [('insert', '2.0', 'x')]
+  assert diffEdits('ab\ncd', 'abcd') == [('delete', '1.2', '2.0')]
+  assert diffEdits('aaa', 'aaaa') == [('insert', '1.3', 'a')]
+
+
+def test_diff_random():
+  rnd = random.Random(1)
+  for _ in range(500):
+    old = ''.join(rnd.choice('ab\n') for _ in range(rnd.randint(0, 30)))
+    new = ''.join(rnd.choice('ab\n') for _ in range(rnd.randint(0, 30)))
+    edits = diffEdits(old, new)
+    assert _apply(old, edits) == new
+    assert len(edits) <= 2